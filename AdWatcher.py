@@ -0,0 +1,119 @@
+import logging
+import time
+from selenium.webdriver.common.by import By
+
+
+class AdWatcher:
+    SKIP_SELECTOR = ".ytp-skip-ad-button, .ytp-ad-skip-button, .ytp-ad-skip-button-modern"
+
+    # Installed once per page: watches the player with a MutationObserver and queues
+    # ad_start / skip_available / ad_end events stamped with the browser's wall clock (ms)
+    INSTALL_SCRIPT = """
+        if (window.__adWatcher) return true;
+        const player = document.querySelector('.html5-video-player') || document.querySelector('#movie_player');
+        if (!player) return false;
+        const skipSelector = arguments[0];
+        const watcher = window.__adWatcher = {
+            events: [], waiting: null, adShowing: false, skipAvailable: false,
+            now: () => performance.timeOrigin + performance.now(),
+            push(type) {
+                this.events.push({type: type, time: this.now()});
+                if (this.waiting) { const resolve = this.waiting; this.waiting = null; resolve(); }
+            },
+            check() {
+                const adShowing = player.classList.contains('ad-showing');
+                const skip = player.querySelector(skipSelector);
+                const skipAvailable = adShowing && !!skip && skip.offsetParent !== null;
+                if (adShowing && !this.adShowing) this.push('ad_start');
+                if (skipAvailable && !this.skipAvailable) this.push('skip_available');
+                if (!adShowing && this.adShowing) this.push('ad_end');
+                this.adShowing = adShowing;
+                this.skipAvailable = skipAvailable;
+            },
+            drain() {
+                const events = this.events;
+                this.events = [];
+                return {events: events, ad_showing: this.adShowing, skip_available: this.skipAvailable};
+            }
+        };
+        new MutationObserver(() => watcher.check()).observe(player, {
+            attributes: true, attributeFilter: ['class', 'style'], childList: true, subtree: true
+        });
+        watcher.check();
+        return true;
+    """
+
+    # Resolves as soon as an event is queued, or after the timeout, with everything queued so far
+    WAIT_SCRIPT = """
+        const timeout = arguments[0], done = arguments[arguments.length - 1];
+        const watcher = window.__adWatcher;
+        if (!watcher) return done(null);
+        if (watcher.events.length) return done(watcher.drain());
+        const timer = setTimeout(() => { watcher.waiting = null; done(watcher.drain()); }, timeout);
+        watcher.waiting = () => { clearTimeout(timer); done(watcher.drain()); };
+    """
+
+    def __init__(self, driver, on_event=None):
+        # Track ads in the current watch page; on_event(kind, timestamp) gets every event
+        self.driver = driver
+        self.on_event = on_event
+        self.ad_showing = False
+        self.skip_available = False
+        # Offset between the browser's wall clock and time.perf_counter()
+        self.clock_offset = time.time() - time.perf_counter()
+
+    def install(self):
+        # Inject the observer into the page; returns False if the player is not there yet
+        installed = self.driver.execute_script(self.INSTALL_SCRIPT, self.SKIP_SELECTOR)
+        if installed:
+            logging.info("Ad watcher installed")
+        return installed
+
+    def wait(self, timeout):
+        # Block until the page reports ad events (or the timeout passes) and process them in one call
+        self.driver.set_script_timeout(timeout + 5)
+        state = self.driver.execute_async_script(self.WAIT_SCRIPT, int(timeout * 1000))
+        if state is None:
+            # The page was replaced: the observer is gone and has to be installed again
+            if not self.install():
+                time.sleep(timeout)
+            return []
+        for event in state["events"]:
+            self._handle(event["type"], event["time"] / 1000 - self.clock_offset)
+        self.ad_showing = state["ad_showing"]
+        self.skip_available = state["skip_available"]
+        return state["events"]
+
+    def _handle(self, kind, timestamp):
+        # Pass the event on; the recording pairs ad_start and ad_end into chapters
+        logging.info(f"Ad event: {kind}")
+        if self.on_event:
+            self.on_event(kind, timestamp)
+
+    def skip(self):
+        # Click the skip button with a real WebDriver click; returns True if it was clicked
+        buttons = [button for button in self.driver.find_elements(By.CSS_SELECTOR, self.SKIP_SELECTOR)
+                   if button.is_displayed()]
+        if not buttons:
+            return False
+        try:
+            buttons[0].click()
+        except Exception as e:
+            logging.warning(f"Could not click the skip button: {str(e)}")
+            return False
+        logging.info("Advertisement skipped")
+        return True
+
+    def watch(self, duration, until_no_ad=False):
+        # Handle ads for the given time, skipping each one as soon as skipping is possible;
+        # with until_no_ad it returns as soon as no ad is showing
+        deadline = time.perf_counter() + duration
+        while True:
+            if self.skip_available and self.skip():
+                self.skip_available = False
+            if until_no_ad and not self.ad_showing:
+                return
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return
+            self.wait(min(remaining, 5))
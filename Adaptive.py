@@ -0,0 +1,141 @@
+import logging
+import cv2
+
+INTERPOLATION_NAMES = {cv2.INTER_AREA: "area", cv2.INTER_LINEAR: "linear", cv2.INTER_NEAREST: "nearest"}
+
+
+class QualityLevel:
+    def __init__(self, interpolation, fps):
+        # One rung of the quality ladder
+        self.interpolation = interpolation  # Downscale filter used by the convert stage
+        self.fps = fps  # Capture rate
+
+    def __str__(self):
+        return f"{self.fps:g} fps, {INTERPOLATION_NAMES.get(self.interpolation, self.interpolation)} scaling"
+
+
+class AdaptiveController:
+    def __init__(self, target_fps, min_fps=10, scaling=True, window=1.0, high_load=0.9, low_load=0.5,
+                 down_windows=2, up_windows=5, fps_step=0.75):
+        # Watch the per-frame cost of each stage and the queue depths once per window, and turn the knob
+        # that relieves the busiest stage: a cheaper downscale filter when converting is the bottleneck,
+        # a lower frame rate (down to min_fps) otherwise. The two knobs move independently
+        self.window = window  # Seconds between evaluations
+        self.high_load = high_load  # Step down once the busiest stage needs this share of the frame period
+        self.low_load = low_load  # Step up if the next rung would still stay under this share
+        self.down_windows = down_windows  # Consecutive overloaded windows before stepping down
+        self.up_windows = up_windows  # Consecutive quiet windows before stepping up (slower, to avoid flapping)
+        # The interpolation rungs only matter when frames are actually downscaled
+        self.interpolations = [cv2.INTER_AREA, cv2.INTER_LINEAR, cv2.INTER_NEAREST] if scaling else [cv2.INTER_AREA]
+        self.rates = self.build_rates(target_fps, min_fps, fps_step)
+        self.filter = 0  # Index into interpolations; 0 is the best filter
+        self.rate = 0  # Index into rates; 0 is the target frame rate
+        self.overloaded = 0  # Consecutive windows over high_load
+        self.quiet = 0  # Consecutive windows with headroom
+        self.last_sample = None  # Pipeline counters at the start of the current window
+        self.last_time = None
+        self.changes = []  # Every adjustment, for the session report
+
+    @staticmethod
+    def build_rates(target_fps, min_fps, fps_step):
+        # Frame rates from the target down to min_fps, each fps_step times the one before
+        rates = [target_fps]
+        fps = target_fps * fps_step
+        while fps > min_fps:
+            rates.append(round(fps, 1))
+            fps *= fps_step
+        if rates[-1] > min_fps:
+            rates.append(min_fps)
+        return rates
+
+    def level(self, filter, rate):
+        return QualityLevel(self.interpolations[filter], self.rates[rate])
+
+    @property
+    def current(self):
+        return self.level(self.filter, self.rate)
+
+    def step_down(self, stage):
+        # The (filter, rate) that relieves the given stage, or None when its knob is already at the bottom.
+        # A cheaper filter only helps the convert stage; a lower frame rate helps every stage
+        if stage == "convert" and self.filter < len(self.interpolations) - 1:
+            return self.filter + 1, self.rate
+        if self.rate < len(self.rates) - 1:
+            return self.filter, self.rate + 1
+        return None
+
+    def step_up(self):
+        # The (filter, rate) to go back to once there is headroom: the frame rate first, then the filter
+        if self.rate:
+            return self.filter, self.rate - 1
+        if self.filter:
+            return self.filter - 1, self.rate
+        return None
+
+    @staticmethod
+    def sample(pipeline):
+        # Cumulative counters the load is computed from
+        encoder = pipeline.encoder
+        return {
+            "captured": pipeline.captured,
+            "grab_time": pipeline.grab_time,
+            "converted": pipeline.converted,
+            "convert_time": pipeline.convert_time,
+            "encoded": encoder.frame_count,
+            "encode_time": encoder.busy_time,
+            "dropped": pipeline.convert_queue.dropped + encoder.frames.dropped,
+            "missed": pipeline.missed,
+        }
+
+    def update(self, pipeline, now):
+        # Called by the capture loop; returns the new QualityLevel when the level changes, else None
+        if self.last_time is None:
+            self.last_sample, self.last_time = self.sample(pipeline), now
+            return None
+        if now - self.last_time < self.window:
+            return None
+        sample = self.sample(pipeline)
+        delta = {key: sample[key] - self.last_sample[key] for key in sample}
+        self.last_sample, self.last_time = sample, now
+
+        # Each stage runs in its own thread, so the slowest per-frame cost bounds the frame rate
+        costs = {
+            "grab": delta["grab_time"] / delta["captured"] if delta["captured"] else 0.0,
+            "convert": delta["convert_time"] / delta["converted"] if delta["converted"] else 0.0,
+            "encode": delta["encode_time"] / delta["encoded"] if delta["encoded"] else 0.0,
+        }
+        stage = max(costs, key=costs.get)
+        load = costs[stage] * self.current.fps
+        backlog = max(len(pipeline.convert_queue) / pipeline.convert_queue.maxsize,
+                      len(pipeline.encoder.frames) / pipeline.encoder.frames.maxsize)
+
+        up = self.step_up()
+        if load > self.high_load or delta["dropped"] or delta["missed"] or backlog >= 1.0:
+            self.overloaded += 1
+            self.quiet = 0
+        elif up and load * self.rates[up[1]] / self.current.fps < self.low_load and backlog < 0.5:
+            self.quiet += 1
+            self.overloaded = 0
+        else:
+            self.overloaded = self.quiet = 0
+
+        if self.overloaded >= self.down_windows:
+            down = self.step_down(stage)
+            if down:
+                return self.change(*down, now, f"{stage} at {load:.0%} of the frame period, "
+                                               f"{delta['dropped']} dropped, {delta['missed']} ticks missed, "
+                                               f"backlog {backlog:.0%}")
+        if self.quiet >= self.up_windows:
+            return self.change(*up, now, f"{stage} at {load:.0%} of the frame period")
+        return None
+
+    def change(self, filter, rate, now, reason):
+        previous = self.current
+        direction = "down" if (filter, rate) > (self.filter, self.rate) else "up"
+        self.filter, self.rate = filter, rate
+        self.overloaded = self.quiet = 0
+        logging.info(f"Adaptive quality: stepping {direction} to {self.current} from {previous}: {reason}")
+        self.changes.append({"time": now, "fps": self.current.fps,
+                             "interpolation": INTERPOLATION_NAMES.get(self.current.interpolation),
+                             "reason": reason})
+        return self.current
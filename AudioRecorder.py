@@ -0,0 +1,230 @@
+import collections
+import logging
+import math
+import os
+import subprocess
+import time
+import numpy as np
+from Metrics import NULL_METRICS
+from Encoder import Encoder, ffmpeg_binary
+
+
+class AudioRecorder:
+    def __init__(self, output_file, record_sec, clock_origin, sample_rate=44100, chunk_duration=0.05, meter=None,
+                 source=None, segment_time=None, microphone=None, metrics=NULL_METRICS):
+        # Record loopback audio in chunks, writing each one to disk as it arrives
+        self.output_file = output_file  # Lossless WAV written incrementally
+        self.record_sec = record_sec
+        self.clock_origin = clock_origin  # time.perf_counter() value shared with the video frames
+        self.sample_rate = sample_rate
+        self.chunk_duration = chunk_duration  # 50ms chunks for better sync with video
+        self.meter = meter  # Optional LoudnessMeter fed with every chunk
+        self.source = source  # Speaker name or exact source id (e.g. 'sink.monitor') to record; None uses the default
+        self.microphone = microphone  # Recorder to use instead of the sound card loopback (e.g. a benchmark tone)
+        self.segment_time = segment_time  # Seconds per WAV and AAC segment; None writes a single WAV
+        self.playlist = None  # ffconcat list of the finished segments
+        self.files = []  # Every file written so far
+        self.aac = None  # ffmpeg encoding the segments to AAC as they are recorded, so the mux only copies
+        self.aac_list = None  # CSV of the finished AAC segments and their start times, kept up to date by ffmpeg
+        self.encoded_playlist = None  # ffconcat list joining the AAC segments, written when the recording ends
+        self.encode_error = None  # Why the AAC segments can't be used; the mux then encodes the WAVs itself
+        self.samples = 0  # Samples written so far
+        self.start_time = None  # Estimated clock time of the first sample
+        self.drift = None  # How far the sample clock moved against the shared clock
+        self.error = None  # Error that ended the recording, if any
+        self.underruns = 0  # Gaps where samples were lost, found by chunks staying a whole chunk late
+        self.padded = 0.0  # Seconds of silence written in place of lost samples
+        self.out = None  # File being written
+        self.written = 0  # Samples in the current file
+        self.metrics = metrics  # Chunk wait times and underruns (no-op unless enabled)
+
+    def record(self, ready_event, stop_event):
+        # Record until the duration elapses or the stop event is set; never leaves the video side waiting
+        try:
+            self._record(ready_event, stop_event)
+        except Exception as e:
+            self.error = str(e)
+            logging.error(f"Audio recording failed: {self.error}")
+        finally:
+            ready_event.set()
+
+    def _record(self, ready_event, stop_event):
+        # Use soundcard library to record audio from the speaker's loopback
+        chunk_samples = int(self.sample_rate * self.chunk_duration)
+        total_samples = int(self.record_sec / self.chunk_duration) * chunk_samples  # Padding counts towards it
+        segment_samples = int(self.sample_rate * self.segment_time) if self.segment_time else None
+        if segment_samples:
+            self.playlist = os.path.splitext(self.output_file)[0] + ".ffconcat"
+            with open(self.playlist, 'w') as f:
+                f.write("ffconcat version 1.0\n")
+
+        # A chunk is never delivered before its last sample was captured, so the smallest
+        # (arrival time - recorded duration) is the best estimate of when the first sample was taken
+        earliest = None  # Best estimate over the whole session
+        baseline = None  # Same estimate, moved forward after each gap filled with silence
+        first_starts = []  # Estimates from the first chunks
+        last_starts = collections.deque(maxlen=20)  # Estimates from the most recent chunks
+        # A chunk arriving late either means samples were lost, or only that this thread stalled while the
+        # sound server kept buffering: then the following chunks come back at once and the estimate returns
+        # to the baseline. Late chunks are held back until it is clear which one it was
+        held = []  # (chunk, start) received since the late chunk
+        lowest = None  # Smallest estimate among the held chunks
+        hold_chunks = 0  # Chunks to wait for the buffered audio to drain before calling it a gap
+
+        def emit(chunk, start, gap=0):
+            # Write a chunk, after `gap` samples of silence standing in for lost audio
+            nonlocal baseline
+            if gap:
+                self.write_samples(np.zeros(gap, dtype=chunk.dtype), segment_samples)
+            baseline = start if baseline is None else min(baseline, start)
+            if len(first_starts) < last_starts.maxlen:
+                first_starts.append(start)
+            last_starts.append(start)
+            self.write_samples(chunk, segment_samples)
+
+        def release(gap=0):
+            # Write the held chunks, shifted by the silence put in front of them
+            for i, (chunk, start) in enumerate(held):
+                emit(chunk, start - gap / self.sample_rate, gap if i == 0 else 0)
+            held.clear()
+
+        mic = self.microphone
+        if mic is None:
+            import soundcard as sc  # Only needed, and only importable, where a sound server is running
+            mic = sc.get_microphone(id=str(self.source or sc.default_speaker().name), include_loopback=True)
+        self.out = self.open_file()
+        self.written = 0
+        if segment_samples:
+            self.start_aac()
+        try:
+            with mic.recorder(samplerate=self.sample_rate) as recorder:
+                ready_event.set()  # Signal that audio recording is ready to start
+
+                while self.samples < total_samples:
+                    if stop_event.is_set():
+                        logging.warning("Audio recording stopped early due to stop signal.")
+                        break
+                    waited = time.perf_counter()
+                    chunk = recorder.record(numframes=chunk_samples)[:, 0]  # Record a chunk of audio
+                    arrived = time.perf_counter() - self.clock_origin
+                    self.metrics.observe('audio_chunk_wait_seconds', arrived + self.clock_origin - waited)
+                    self.samples += len(chunk)
+
+                    start = arrived - self.samples / self.sample_rate
+                    earliest = start if earliest is None else min(earliest, start)
+                    if held:
+                        held.append((chunk, start))
+                        lowest = min(lowest, start)
+                        if lowest - baseline <= self.chunk_duration:
+                            release()  # The backlog drained: nothing was lost
+                        elif len(held) > hold_chunks:
+                            # Still a whole chunk behind once the buffered audio is through: samples were lost,
+                            # fill the gap with silence so every later sample keeps its place against the video
+                            gap = round((lowest - baseline) * self.sample_rate)
+                            self.underruns += 1
+                            self.metrics.count('audio_underruns')
+                            self.samples += gap
+                            self.padded += gap / self.sample_rate
+                            release(gap)
+                    elif baseline is not None and start - baseline > self.chunk_duration:
+                        held.append((chunk, start))
+                        lowest = start
+                        hold_chunks = math.ceil((start - baseline) / self.chunk_duration) + 2
+                    else:
+                        emit(chunk, start)
+                release()  # Ended while checking a late chunk: keep what arrived, unpadded
+        finally:
+            self.close_file(self.out)
+            if self.aac:
+                self.finish_aac()
+
+        if first_starts:
+            self.start_time = earliest
+            self.drift = min(last_starts) - min(first_starts)
+        if self.meter:
+            self.meter.finish()
+        logging.info(f"Audio recording saved to {self.playlist or self.output_file} "
+                     f"({self.samples / self.sample_rate:.2f} s)")
+
+    def write_samples(self, samples, segment_samples):
+        # Append samples to the current file right away, moving on to a new segment once it is full
+        self.out.write(samples)
+        self.written += len(samples)
+        if self.aac:
+            self.feed_aac(samples)
+        if self.meter:
+            self.meter.add(samples)
+        if segment_samples and self.written >= segment_samples:
+            # Close the full segment so it is complete on disk, and continue in a new one
+            self.close_file(self.out)
+            self.out = self.open_file()
+            self.written = 0
+
+    def open_file(self):
+        # Start the next output file: the single WAV, or the next numbered segment
+        if self.playlist:
+            path = f"{os.path.splitext(self.output_file)[0]}_{len(self.files):05d}.wav"
+        else:
+            path = self.output_file
+        import soundfile as sf  # Imported when the recording starts, not when the module is loaded
+        self.files.append(path)
+        return sf.SoundFile(path, 'w', samplerate=self.sample_rate, channels=1, format='WAV', subtype='FLOAT')
+
+    def close_file(self, out):
+        # Finish a file; closed segments are listed in the playlist so they can be joined later
+        out.close()
+        if self.playlist:
+            with open(self.playlist, 'a') as f:
+                f.write(f"file '{os.path.basename(self.files[-1])}'\n")
+
+    def start_aac(self):
+        # One AAC stream for the whole recording, cut into segments by ffmpeg's segment muxer: encoding it
+        # once keeps the encoder from priming every segment anew, which would shift the audio after each cut
+        base = os.path.splitext(self.output_file)[0] + "_aac"
+        self.aac_list = base + ".csv"
+        self.encoded_playlist = base + ".ffconcat"
+        self.aac = subprocess.Popen([
+            ffmpeg_binary(), '-y', '-loglevel', 'error',
+            '-f', 'f32le', '-ar', str(self.sample_rate), '-ac', '1', '-i', 'pipe:0',
+            '-c:a', 'aac', '-f', 'segment', '-segment_time', str(self.segment_time), '-segment_format', 'mp4',
+            '-reset_timestamps', '1', '-segment_list', self.aac_list, '-segment_list_type', 'csv',
+            base + "_%05d.m4a"
+        ], stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def feed_aac(self, samples):
+        # Hand samples to the AAC encoder; if it fails the recording goes on and the WAV segments are used
+        if self.encode_error:
+            return
+        try:
+            self.aac.stdin.write(np.asarray(samples, dtype=np.float32).tobytes())
+        except OSError as e:
+            self.encode_error = str(e)
+            logging.error(f"AAC encoder for the audio segments failed: {self.encode_error}")
+
+    def finish_aac(self):
+        # Flush the AAC encoder and list its segments for the mux
+        try:
+            self.aac.stdin.close()
+        except OSError:
+            pass
+        stderr = self.aac.stderr.read().decode(errors='replace').strip()
+        self.aac.wait()
+        if self.aac.returncode != 0 and not self.encode_error:
+            self.encode_error = f"ffmpeg exited with code {self.aac.returncode}: {stderr}"
+            logging.error(f"AAC encoder for the audio segments failed: {self.encode_error}")
+        # The encoder's priming samples (1024 for ffmpeg's AAC) lead the first segment; skip them there
+        Encoder.write_playlist(self.aac_list, self.encoded_playlist, inpoint=1024 / self.sample_rate)
+
+    @property
+    def segments_encoded(self):
+        # Whether the whole recording is available as AAC segments, so the audio can be muxed without re-encoding
+        return bool(self.encoded_playlist and os.path.exists(self.encoded_playlist) and not self.encode_error)
+
+    def remove_output(self):
+        # Delete the intermediate audio files and their playlists
+        paths = self.files + [path for path in (self.playlist, self.aac_list, self.encoded_playlist) if path]
+        if self.encoded_playlist and os.path.exists(self.encoded_playlist):
+            paths += Encoder.playlist_files(self.encoded_playlist)
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
@@ -0,0 +1,116 @@
+import logging
+import os
+import queue
+import threading
+from selenium import webdriver
+from selenium.webdriver.firefox.options import Options
+
+
+class BrowserSession:
+    def __init__(self, slot, driver):
+        # A warm WebDriver session bound to one of the pool's profiles
+        self.slot = slot  # Index of the profile directory the browser runs on
+        self.driver = driver
+        self.uses = 0  # Jobs run on this browser since it was launched
+
+
+class BrowserPool:
+    def __init__(self, size=1, max_uses=20, profile_dir="browser_profiles"):
+        # Keep up to `size` Firefox sessions alive between jobs, each on its own persistent profile
+        self.size = size
+        self.max_uses = max_uses  # Relaunch a browser after this many jobs
+        self.profile_dir = profile_dir
+        self.idle = queue.Queue()  # Sessions ready for the next job
+        self.free_slots = queue.Queue()  # Profiles with no browser running on them
+        for slot in range(size):
+            self.free_slots.put(slot)
+        self.sessions = set()  # Every live session, idle or leased
+        self.lock = threading.Lock()
+
+    def launch(self, slot):
+        # Start Firefox on the slot's profile so cookies (e.g. consent) survive relaunches
+        profile = os.path.abspath(os.path.join(self.profile_dir, f"profile_{slot}"))
+        os.makedirs(profile, exist_ok=True)
+        options = Options()
+        options.add_argument("-profile")
+        options.add_argument(profile)
+        driver = webdriver.Firefox(options=options)
+        logging.info(f"Launched browser for profile {slot}")
+        session = BrowserSession(slot, driver)
+        with self.lock:
+            self.sessions.add(session)
+        return session
+
+    def acquire(self):
+        # Lease a warm session, launching one if a profile is free, otherwise waiting for a release
+        while True:
+            try:
+                session = self.idle.get_nowait()
+            except queue.Empty:
+                try:
+                    return self.launch(self.free_slots.get_nowait())
+                except queue.Empty:
+                    session = self.idle.get()
+            if self.is_alive(session):
+                return session
+            logging.warning(f"Browser for profile {session.slot} is no longer responding, evicting it")
+            self.evict(session)
+
+    def release(self, session):
+        # Return a session after a job: reset it for reuse, or evict it if it crashed or is worn out
+        session.uses += 1
+        if not self.is_alive(session):
+            logging.warning(f"Browser for profile {session.slot} crashed, evicting it")
+            self.evict(session)
+        elif session.uses >= self.max_uses:
+            logging.info(f"Browser for profile {session.slot} reached {session.uses} jobs, evicting it")
+            self.evict(session)
+        else:
+            try:
+                self.reset(session.driver)
+            except Exception as e:
+                logging.warning(f"Could not reset browser for profile {session.slot}: {str(e)}")
+                self.evict(session)
+                return
+            self.idle.put(session)
+
+    @staticmethod
+    def is_alive(session):
+        # A cheap round trip that fails if the browser or geckodriver died
+        try:
+            session.driver.current_window_handle
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def reset(driver):
+        # Close every tab but one and leave it on a blank page, instead of relaunching
+        handles = driver.window_handles
+        for handle in handles[1:]:
+            driver.switch_to.window(handle)
+            driver.close()
+        driver.switch_to.window(handles[0])
+        driver.get("about:blank")
+
+    def evict(self, session):
+        # Quit the browser and free its profile for a fresh launch
+        with self.lock:
+            self.sessions.discard(session)
+        try:
+            session.driver.quit()
+        except Exception:
+            pass
+        self.free_slots.put(session.slot)
+
+    def close(self):
+        # Quit every browser in the pool
+        with self.lock:
+            sessions = list(self.sessions)
+            self.sessions.clear()
+        for session in sessions:
+            try:
+                session.driver.quit()
+            except Exception:
+                pass
+        logging.info("Browser pool closed")
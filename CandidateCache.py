@@ -0,0 +1,235 @@
+import fcntl
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+
+
+class CandidateCache:
+    # Browser-like headers for the background refresh; the consent cookies skip the EU consent page
+    HEADERS = {
+        "User-Agent": "Mozilla/5.0 (X11; Linux x86_64; rv:128.0) Gecko/20100101 Firefox/128.0",
+        "Accept-Language": "en-US,en;q=0.8",
+        "Cookie": "CONSENT=YES+; SOCS=CAI",
+    }
+    INITIAL_DATA = re.compile(r"ytInitialData\s*=\s*(\{.*?\});\s*</script>", re.DOTALL)
+
+    def __init__(self, path="candidate_cache.json", ttl=6 * 3600, max_age=7 * 24 * 3600, max_entries=500):
+        # Persistent cache of parsed search results, keyed by search query and filter
+        self.path = path
+        self.ttl = ttl  # Older searches are still used, but refreshed in the background
+        self.max_age = max_age  # Older searches are dropped altogether
+        self.max_entries = max_entries  # Total candidates kept; the least recently used go first
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()  # One save at a time; the background refresh saves too
+        self.refreshing = set()  # Keys with a background refresh in flight
+        self.invalidated = set()  # Links this process found unavailable; never merged back in from the file
+        self.searches = self.load()  # key -> {"fetched": time, "candidates": [video, ...]}
+        self.base = self.snapshot(self.searches)  # What the file held when last read or written, for merging
+
+    @staticmethod
+    def key(query, search_filter):
+        return f"{query}|{search_filter}"
+
+    def load(self):
+        # Read the cache file; a missing or corrupt file just means an empty cache
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable candidate cache {self.path}: {str(e)}")
+            return {}
+
+    @staticmethod
+    def snapshot(searches):
+        # key -> (fetched, links) of every search, to tell what changed on either side since then
+        return {key: (search["fetched"], {video["href"] for video in search["candidates"]})
+                for key, search in searches.items()}
+
+    def merge(self, theirs):
+        # Three-way merge of the file written by other processes into memory (lock held): a search
+        # fetched again on either side replaces the old one (the newest wins), otherwise a candidate
+        # survives only if neither side dropped it; the latest use of each candidate is kept
+        merged = {}
+        for key in set(self.searches) | set(theirs):
+            mine, other = self.searches.get(key), theirs.get(key)
+            base_fetched, base_links = self.base.get(key, (None, set()))
+            refetched = [search for search in (mine, other) if search and search["fetched"] != base_fetched]
+            if refetched:
+                search = max(refetched, key=lambda search: search["fetched"])
+                links = {video["href"] for video in search["candidates"]}
+            elif mine and other:
+                search = mine
+                links = base_links & {video["href"] for video in mine["candidates"]} \
+                    & {video["href"] for video in other["candidates"]}
+            else:
+                continue  # Unchanged on one side and removed (expired or evicted) on the other
+            used = {}
+            for side in (mine, other):
+                for video in side["candidates"] if side else []:
+                    used[video["href"]] = max(used.get(video["href"], 0), video.get("used", 0))
+            candidates = [dict(video, used=used[video["href"]]) for video in search["candidates"]
+                          if video["href"] in links and video["href"] not in self.invalidated]
+            if candidates:
+                merged[key] = {"fetched": search["fetched"], "candidates": candidates}
+        self.searches = merged
+        self.evict()
+        self.base = self.snapshot(self.searches)
+
+    def reload(self):
+        # Pick up what other processes saved since the file was last read
+        with open(self.path + ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_SH)
+            theirs = self.load()
+        with self.lock:
+            self.merge(theirs)
+
+    def save(self):
+        # Merge with the file under an exclusive lock, so parallel sessions sharing the cache never undo
+        # each other's changes, then write to a uniquely named temporary file and swap it in, so a crash
+        # never leaves a truncated cache
+        with self.save_lock, open(self.path + ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            theirs = self.load()
+            with self.lock:
+                self.merge(theirs)
+                data = json.dumps(self.searches, indent=1)
+            fd, temp = tempfile.mkstemp(prefix=os.path.basename(self.path) + ".", suffix=".tmp",
+                                        dir=os.path.dirname(os.path.abspath(self.path)))
+            try:
+                with os.fdopen(fd, "w") as f:
+                    f.write(data)
+                os.replace(temp, self.path)
+            except BaseException:
+                os.remove(temp)
+                raise
+
+    def get(self, query, search_filter):
+        # Return (candidates, stale) for the search; candidates is empty on a miss or once expired
+        key = self.key(query, search_filter)
+        self.reload()
+        now = time.time()
+        with self.lock:
+            search = self.searches.get(key)
+            if not search or not search["candidates"]:
+                return [], True
+            age = now - search["fetched"]
+            if age > self.max_age:
+                del self.searches[key]
+                return [], True
+            return list(search["candidates"]), age > self.ttl
+
+    def put(self, query, search_filter, videos):
+        # Replace the candidates of a search with freshly parsed ones
+        now = time.time()
+        with self.lock:
+            self.searches[self.key(query, search_filter)] = {
+                "fetched": now,
+                "candidates": [dict(video, used=now) for video in videos],
+            }
+            self.evict()
+        self.save()
+        logging.info(f"Cached {len(videos)} candidates for '{query}'")
+
+    def touch(self, href):
+        # Mark a candidate as just used so it is the last to be evicted
+        now = time.time()
+        with self.lock:
+            for search in self.searches.values():
+                for video in search["candidates"]:
+                    if video["href"] == href:
+                        video["used"] = now
+        self.save()
+
+    def invalidate(self, href):
+        # Drop a candidate that turned out to be unavailable from every search
+        with self.lock:
+            self.invalidated.add(href)
+            for search in self.searches.values():
+                search["candidates"] = [video for video in search["candidates"] if video["href"] != href]
+        self.save()
+        logging.info(f"Removed unavailable video {href} from the candidate cache")
+
+    def evict(self):
+        # Keep at most max_entries candidates in total, dropping the least recently used (lock held)
+        entries = [(video.get("used", 0), key, video["href"])
+                   for key, search in self.searches.items() for video in search["candidates"]]
+        excess = len(entries) - self.max_entries
+        if excess <= 0:
+            return
+        doomed = {(key, href) for _, key, href in sorted(entries)[:excess]}
+        for key, search in self.searches.items():
+            search["candidates"] = [video for video in search["candidates"] if (key, video["href"]) not in doomed]
+        for key in [key for key, search in self.searches.items() if not search["candidates"]]:
+            del self.searches[key]
+
+    def refresh_async(self, query, search_filter, url, min_duration):
+        # Refresh a stale search in a background thread without touching the browser
+        key = self.key(query, search_filter)
+        with self.lock:
+            if key in self.refreshing:
+                return
+            self.refreshing.add(key)
+        threading.Thread(target=self.refresh, args=(query, search_filter, url, min_duration), daemon=True).start()
+
+    def refresh(self, query, search_filter, url, min_duration):
+        # Fetch the search page over plain HTTP and cache its long videos
+        import urllib.request  # Pulls in ssl and email; only needed when a refresh actually runs
+        try:
+            request = urllib.request.Request(url, headers=self.HEADERS)
+            with urllib.request.urlopen(request, timeout=15) as response:
+                page = response.read().decode("utf-8", errors="replace")
+            videos = [video for video in self.parse(page)
+                      if video["duration_seconds"] and video["duration_seconds"] > min_duration]
+            if videos:
+                self.put(query, search_filter, videos)
+            else:
+                logging.warning("Background search refresh found no suitable videos, keeping the cached ones")
+        except Exception as e:
+            logging.warning(f"Background search refresh failed: {str(e)}")
+        finally:
+            with self.lock:
+                self.refreshing.discard(self.key(query, search_filter))
+
+    @classmethod
+    def parse(cls, page):
+        # Extract link, title and duration of every video in the page's embedded ytInitialData
+        match = cls.INITIAL_DATA.search(page)
+        if not match:
+            return []
+        videos = []
+        stack = [json.loads(match.group(1))]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, list):
+                stack.extend(reversed(node))
+            elif isinstance(node, dict):
+                renderer = node.get("videoRenderer")
+                if isinstance(renderer, dict) and renderer.get("videoId"):
+                    duration = renderer.get("lengthText", {}).get("simpleText", "")
+                    runs = renderer.get("title", {}).get("runs") or [{}]
+                    videos.append({
+                        "href": f"https://www.youtube.com/watch?v={renderer['videoId']}",
+                        "title": runs[0].get("text", ""),
+                        "duration": duration,
+                        "duration_seconds": cls.to_seconds(duration),
+                    })
+                else:
+                    stack.extend(reversed(list(node.values())))
+        return videos
+
+    @staticmethod
+    def to_seconds(text):
+        # "m:ss" or "h:mm:ss" to seconds, None for anything else (live streams, premieres)
+        parts = text.strip().split(":")
+        if not 2 <= len(parts) <= 3 or not all(part.isdigit() for part in parts):
+            return None
+        seconds = 0
+        for part in parts:
+            seconds = seconds * 60 + int(part)
+        return seconds
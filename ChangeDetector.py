@@ -0,0 +1,35 @@
+import cv2
+import numpy as np
+
+
+class ChangeDetector:
+    def __init__(self, step=8, threshold=0, max_gap=1.0):
+        # Compare a block-mean thumbnail of consecutive frames to spot duplicates cheaply; every pixel
+        # contributes to its block, so thin changes (a progress bar, a cursor) are not missed
+        self.step = step  # Side of the square block averaged into one thumbnail pixel
+        self.threshold = threshold  # Largest per-block difference still treated as identical
+        self.max_gap = max_gap  # Keep at least one frame this often (seconds) even if nothing changed
+        self.previous = None  # Thumbnail of the last kept frame
+        self.current = None  # Preallocated buffer the next thumbnail is written into
+        self.last_kept = None  # Timestamp of the last kept frame
+
+    def changed(self, img, timestamp):
+        # Return True if the grabbed BGRA screenshot differs from the last kept frame
+        pixels = np.frombuffer(img.raw, dtype=np.uint8).reshape(img.height, img.width, 4)
+        size = (-(-img.width // self.step), -(-img.height // self.step))  # Thumbnail (width, height), rounded up
+        if self.current is None or self.current.shape[:2] != (size[1], size[0]):
+            self.current = np.empty((size[1], size[0], 4), dtype=np.uint8)
+            self.previous = None
+        cv2.resize(pixels, size, dst=self.current, interpolation=cv2.INTER_AREA)
+        if self.previous is not None and timestamp - self.last_kept < self.max_gap:
+            if self.threshold:
+                different = cv2.absdiff(self.current, self.previous).max() > self.threshold
+            else:
+                different = not np.array_equal(self.current, self.previous)
+            if not different:
+                return False
+        if self.previous is None:
+            self.previous = np.empty_like(self.current)
+        self.previous, self.current = self.current, self.previous  # Keep this thumbnail, reuse the old buffer
+        self.last_kept = timestamp
+        return True
@@ -0,0 +1,224 @@
+import csv
+import logging
+import os
+import subprocess
+import threading
+import time
+from StageQueue import StageQueue
+from SpillStore import SpillStore, SpillQueue
+from Matroska import MatroskaWriter
+from Metrics import NULL_METRICS
+
+
+def ffmpeg_binary():
+    # Resolved when the encoder starts rather than at import: importing MoviePy is slow
+    from moviepy.config import get_setting
+    return get_setting("FFMPEG_BINARY")
+
+
+class Encoder:
+    def __init__(self, output_file, width, height, fps, queue_size=8, policy='block', preset='ultrafast',
+                 segment_time=None, metrics=NULL_METRICS, memory_limit=None, spill_dir=None):
+        # Initialize the encoder with the output file, frame geometry and the nominal frame rate
+        # (used to time frames that arrive without a capture timestamp)
+        self.output_file = output_file
+        self.segment_time = segment_time  # Seconds per self-contained MP4 segment; None writes a single file
+        self.segment_list = None  # CSV of the finished segments and their start times, kept up to date by ffmpeg
+        self.playlist = None  # ffconcat list joining the segments at their real start times
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.preset = preset
+        self.spill = None  # Memory-mapped store taking the frames that don't fit in memory_limit
+        if memory_limit:
+            # Keep as many frames queued in RAM as the limit allows and spill the rest to disk, never dropping
+            self.spill = SpillStore(width, height, directory=spill_dir)
+            self.frames = SpillQueue('encode', max(2, memory_limit // self.spill.frame_bytes), self.spill)
+        else:
+            self.frames = StageQueue('encode', queue_size, policy)  # Bounded queue feeding the encoder
+        self.process = None  # Long-running ffmpeg process
+        self.thread = None  # Thread feeding frames into ffmpeg
+        self.frame_count = 0  # Number of frames handed to ffmpeg
+        self.first_timestamp = None  # Capture time of the first frame (seconds); the video starts there
+        self.last_timestamp = None  # Presentation time of the last frame written (ms)
+        self.writer = None  # Matroska stream carrying each frame's timestamp into ffmpeg
+        self.error = None  # First error raised while feeding ffmpeg
+        self.metrics = metrics  # Records how long each frame takes to go into the ffmpeg pipe
+        self.busy_time = 0.0  # Total seconds spent writing frames into the pipe
+
+    def start(self):
+        # Launch ffmpeg reading timestamped raw BGR frames from stdin and encoding them to H.264 as they arrive
+        command = [
+            ffmpeg_binary(), '-y', '-loglevel', 'error',
+            '-f', 'matroska', '-i', 'pipe:0',
+            '-an', '-c:v', 'libx264', '-preset', self.preset, '-pix_fmt', 'yuv420p',
+            '-vsync', 'passthrough',  # Keep the capture timestamps: variable frame rate output
+            '-enc_time_base', '-1',  # in the input's millisecond time base, not rounded to a guessed frame rate
+        ]
+        if self.segment_time:
+            # Start a new MP4 on a forced keyframe every segment_time seconds; each one is playable
+            # on its own as soon as it is closed, so a crash only loses the segment being written
+            base = os.path.splitext(self.output_file)[0]
+            self.segment_list = base + "_segments.csv"
+            self.playlist = base + ".ffconcat"
+            command += [
+                '-force_key_frames', f"expr:gte(t,n_forced*{self.segment_time})",
+                '-f', 'segment', '-segment_time', str(self.segment_time), '-segment_format', 'mp4',
+                '-reset_timestamps', '1',
+                '-segment_list', self.segment_list, '-segment_list_type', 'csv',
+                base + "_%05d.mp4"
+            ]
+        else:
+            command.append(self.output_file)
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+        self.writer = MatroskaWriter(self.process.stdin, self.width, self.height)
+        self.writer.write_header()
+        self.thread = threading.Thread(target=self._feed, daemon=True)
+        self.thread.start()
+        logging.info(f"Encoder started: {self.width}x{self.height}, variable frame rate -> {self.output_file}")
+
+    def write(self, frame):
+        # Queue a frame (or a ring slot holding one) for encoding, applying the queue's overload policy
+        if self.error:
+            raise RuntimeError(f"Encoder failed: {self.error}")
+        return self.frames.put(frame)
+
+    def _feed(self):
+        # Move frames from the queue into the ffmpeg pipe until the queue is closed and drained
+        while True:
+            item = self.frames.get()
+            if item is None:
+                break
+            frame = getattr(item, 'frame', item)  # Ring slots and spilled frames carry their frame as a view
+            timestamp = getattr(item, 'timestamp', None)
+            if timestamp is None:
+                timestamp = self.frame_count / self.fps
+            try:
+                if not self.error:
+                    if self.first_timestamp is None:
+                        self.first_timestamp = timestamp
+                    # Frames are written in capture order; make sure their timestamps strictly increase
+                    timestamp = round((timestamp - self.first_timestamp) * 1000)
+                    if self.last_timestamp is not None and timestamp <= self.last_timestamp:
+                        timestamp = self.last_timestamp + 1
+                    started = time.perf_counter()
+                    self.writer.write_frame(timestamp, frame)
+                    write_time = time.perf_counter() - started
+                    self.busy_time += write_time
+                    self.metrics.observe('encode_seconds', write_time)
+                    self.last_timestamp = timestamp
+                    self.frame_count += 1
+            except Exception as e:
+                self.error = str(e)
+                logging.error(f"Error writing frame to encoder: {self.error}")
+            finally:
+                # Hand ring slots and spill records back as soon as their pixels are in the pipe
+                if hasattr(item, 'release'):
+                    item.release()
+
+    def close(self):
+        # Flush the remaining frames, close the pipe and wait for ffmpeg to finish the file
+        self.frames.close()
+        self.thread.join()
+        if self.spill is not None:
+            self.spill.close()
+            if self.spill.spilled:
+                logging.info(f"Encoder read {self.spill.spilled} frames back from the spill store "
+                             f"(peak {self.spill.peak_bytes / 1e6:.0f} MB on disk)")
+        try:
+            self.process.stdin.close()
+        except Exception:
+            pass
+        stderr = self.process.stderr.read().decode(errors='replace').strip()
+        self.process.wait()
+        if self.segment_list:
+            # Also lists the segments finished before a failure, so they can be recovered
+            self.write_playlist(self.segment_list, self.playlist)
+        if self.process.returncode != 0:
+            raise RuntimeError(f"ffmpeg exited with code {self.process.returncode}: {stderr}")
+        logging.info(f"Encoder finished: {self.frame_count} frames written to {self.playlist or self.output_file}")
+
+    @staticmethod
+    def input_args(path):
+        # ffmpeg input options for a media file, or for an ffconcat list joined without re-encoding
+        if path.endswith(".ffconcat"):
+            return ['-f', 'concat', '-safe', '0', '-i', path]
+        return ['-i', path]
+
+    @staticmethod
+    def write_playlist(segment_list, playlist, inpoint=0.0):
+        # Turn a segment list into an ffconcat file. Every segment restarts at 0, so each one is given the
+        # real time to the next segment's start as its duration: without it the concat demuxer would place the
+        # next segment right after this one's last frame, whatever time passed on screen in between.
+        # inpoint skips that much of the first segment
+        if not os.path.exists(segment_list):
+            return
+        with open(segment_list, newline='') as f:
+            segments = [(name, float(start), float(end)) for name, start, end in csv.reader(f)]
+        with open(playlist, 'w') as f:
+            f.write("ffconcat version 1.0\n")
+            for i, (name, start, end) in enumerate(segments):
+                next_start = segments[i + 1][1] if i + 1 < len(segments) else end
+                f.write(f"file '{name}'\n")
+                if i == 0 and inpoint:
+                    f.write(f"inpoint {inpoint:.6f}\n")
+                f.write(f"duration {next_start - start:.6f}\n")
+
+    @staticmethod
+    def playlist_files(playlist):
+        # Paths of the segments listed in an ffconcat file
+        folder = os.path.dirname(playlist)
+        files = []
+        with open(playlist) as f:
+            for line in f:
+                if line.startswith("file "):
+                    files.append(os.path.join(folder, line[5:].strip().strip("'")))
+        return files
+
+    def remove_output(self):
+        # Delete the intermediate video: the single file, or every segment and their list
+        paths = [self.output_file]
+        if self.playlist and os.path.exists(self.playlist):
+            paths = self.playlist_files(self.playlist) + [self.playlist, self.segment_list]
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def mux(self, audio_file, output_file, audio_offset=0.0, duration=None, chapters=None, audio_codec='aac'):
+        # Combine the encoded video with the audio track without re-encoding the video;
+        # audio_offset is where the first audio sample falls relative to the first video frame
+        # and chapters is an optional list of (start, end, title) in seconds; without an
+        # audio_file the video is remuxed on its own. Audio already in AAC is copied with audio_codec='copy'
+        command = [ffmpeg_binary(), '-y', '-loglevel', 'error']
+        command += self.input_args(self.playlist or self.output_file)
+        if audio_file:
+            if audio_offset > 0:
+                command += ['-itsoffset', f"{audio_offset:.4f}"]  # Audio started after the video: delay it
+            elif audio_offset < 0:
+                command += ['-ss', f"{-audio_offset:.4f}"]  # Audio started before the video: skip the extra part
+            command += self.input_args(audio_file)
+        if chapters:
+            metadata_file = os.path.splitext(output_file)[0] + "_chapters.txt"
+            self.write_chapters(metadata_file, chapters)
+            command += ['-i', metadata_file, '-map_chapters', '2' if audio_file else '1']
+        command += ['-map', '0:v:0', '-c:v', 'copy']
+        if audio_file:
+            command += ['-map', '1:a:0', '-c:a', audio_codec]
+        if duration is not None:
+            command += ['-t', f"{duration:.3f}"]
+        command.append(output_file)
+        result = subprocess.run(command, stderr=subprocess.PIPE)
+        if chapters:
+            os.remove(metadata_file)
+        if result.returncode != 0:
+            raise RuntimeError(f"ffmpeg mux failed: {result.stderr.decode(errors='replace').strip()}")
+        logging.info(f"Muxed {'audio and video' if audio_file else 'video without audio'} into {output_file}")
+
+    @staticmethod
+    def write_chapters(path, chapters):
+        # Write chapters in ffmpeg's metadata format
+        with open(path, 'w') as f:
+            f.write(";FFMETADATA1\n")
+            for start, end, title in chapters:
+                f.write(f"[CHAPTER]\nTIMEBASE=1/1000\nSTART={round(start * 1000)}\nEND={round(end * 1000)}\n"
+                        f"title={title}\n")
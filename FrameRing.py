@@ -0,0 +1,60 @@
+import queue
+import numpy as np
+import cv2
+
+
+class FrameSlot:
+    def __init__(self, ring, index, frame):
+        # A handle on one preallocated frame in the ring
+        self.ring = ring
+        self.index = index
+        self.frame = frame  # BGR view into the ring storage
+        self.timestamp = None  # Capture time of the frame currently held
+
+    def release(self):
+        # Give the slot back to the ring once the consumer is done with the frame
+        self.ring.release(self)
+
+
+class FrameRing:
+    def __init__(self, width, height, slots=8, interpolation=cv2.INTER_AREA):
+        # Preallocate a fixed number of BGR frame slots of the given size
+        self.width = width
+        self.height = height
+        self.interpolation = interpolation  # Used when grabbed frames are larger than the slots
+        self.storage = np.empty((slots, self.height, self.width, 3), dtype=np.uint8)
+        self.scaled = np.empty((self.height, self.width, 4), dtype=np.uint8)  # Scratch frame for downscaling
+        self.slots = [FrameSlot(self, i, self.storage[i]) for i in range(slots)]
+        self.free = queue.Queue()  # Slots not currently held by a consumer
+        for slot in self.slots:
+            self.free.put(slot)
+
+    def acquire(self, timeout=None):
+        # Take a free slot, waiting for a consumer to release one if the ring is full
+        return self.free.get(timeout=timeout)
+
+    def release(self, slot):
+        # Return a slot to the free list
+        slot.timestamp = None
+        self.free.put(slot)
+
+    def convert(self, img, timestamp=None, timeout=None):
+        # Convert a grabbed BGRA screenshot into a free slot and return the slot handle
+        slot = self.acquire(timeout=timeout)
+        try:
+            # View the grabbed pixels without copying them and convert into the slot in place
+            pixels = np.frombuffer(img.raw, dtype=np.uint8).reshape(img.height, img.width, 4)
+            if (img.width, img.height) != (self.width, self.height):
+                # Downscale first so the color conversion touches fewer pixels
+                cv2.resize(pixels, (self.width, self.height), dst=self.scaled, interpolation=self.interpolation)
+                pixels = self.scaled
+            cv2.cvtColor(pixels, cv2.COLOR_BGRA2BGR, dst=slot.frame)
+        except Exception:
+            self.release(slot)
+            raise
+        slot.timestamp = timestamp
+        return slot
+
+    def capture(self, sct, screen, timestamp=None, timeout=None):
+        # Grab the screen straight into a free slot and return the slot handle
+        return self.convert(sct.grab(screen), timestamp=timestamp, timeout=timeout)
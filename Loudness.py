@@ -0,0 +1,82 @@
+import csv
+import numpy as np
+
+
+class LoudnessMeter:
+    def __init__(self, sample_rate, window=1.0, silence_db=-50.0, min_silence=3.0):
+        # Track loudness over fixed windows while audio is being recorded
+        self.sample_rate = sample_rate
+        self.window_samples = int(sample_rate * window)
+        self.window = window  # Length of one timeline entry in seconds
+        self.silence_db = silence_db  # Windows quieter than this count as silent
+        self.min_silence = min_silence  # Shortest silent stretch worth flagging (seconds)
+        self.timeline = []  # (start second, RMS, dB) per window
+        self.silent_stretches = []  # (start, end) of long silent stretches in seconds
+        self.total_squares = 0.0  # Running sums for the overall average
+        self.total_samples = 0
+        self.window_squares = 0.0  # Running sums for the window being filled
+        self.window_filled = 0
+        self.silence_start = None  # Start of the current run of silent windows
+
+    @staticmethod
+    def to_db(rms):
+        return 20 * np.log10(rms) if rms > 0 else -float('inf')
+
+    def add(self, samples):
+        # Feed a chunk of mono samples, closing windows as they fill up
+        samples = np.asarray(samples, dtype=np.float64)
+        while len(samples):
+            take = min(len(samples), self.window_samples - self.window_filled)
+            squares = float(np.dot(samples[:take], samples[:take]))
+            self.window_squares += squares
+            self.window_filled += take
+            self.total_squares += squares
+            self.total_samples += take
+            samples = samples[take:]
+            if self.window_filled == self.window_samples:
+                self._close_window()
+
+    def _close_window(self):
+        # Record the finished window and update the silence tracking
+        start = len(self.timeline) * self.window
+        rms = np.sqrt(self.window_squares / self.window_filled)
+        db_level = self.to_db(rms)
+        self.timeline.append((start, rms, db_level))
+        self.window_squares = 0.0
+        self.window_filled = 0
+
+        if db_level < self.silence_db:
+            if self.silence_start is None:
+                self.silence_start = start
+        else:
+            self._end_silence(start)
+
+    def _end_silence(self, end):
+        # Keep the silent stretch that just ended if it was long enough
+        if self.silence_start is not None and end - self.silence_start >= self.min_silence:
+            self.silent_stretches.append((self.silence_start, end))
+        self.silence_start = None
+
+    def finish(self):
+        # Close the last partial window and any silent stretch still open
+        if self.window_filled:
+            self._close_window()
+        self._end_silence(len(self.timeline) * self.window)
+
+    def average_db(self):
+        # Overall level derived from the running sums
+        if not self.total_samples:
+            return -float('inf')
+        return self.to_db(np.sqrt(self.total_squares / self.total_samples))
+
+    def save_csv(self, path):
+        # Write the per-window loudness timeline
+        silent = [False] * len(self.timeline)
+        for start, end in self.silent_stretches:
+            for i in range(int(start / self.window), min(int(end / self.window), len(silent))):
+                silent[i] = True
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(["second", "rms", "db", "silent"])
+            for (start, rms, db_level), is_silent in zip(self.timeline, silent):
+                writer.writerow([f"{start:g}", f"{rms:.6f}", f"{db_level:.2f}", int(is_silent)])
@@ -1,24 +1,48 @@
-from Recording import Recording
-from Selenium import Selenium
+import time
+PROCESS_START = time.perf_counter()  # Taken before anything else is imported, for the time to first frame
+
+# Only light modules are imported up front; the capture stack (OpenCV, NumPy, MoviePy, soundfile) and
+# Selenium are imported by the stage that needs them, while the browser is starting
+from CandidateCache import CandidateCache
+from Metrics import Metrics, NULL_METRICS
+from Preflight import Preflight
+import argparse
 import logging
 import os
 from datetime import datetime
-import time
 import threading
 
 
 class Main:
-    def __init__(self, recording_duration):
+    def __init__(self, recording_duration, capture_scale=1.0, output_folder="Recording", audio_source=None,
+                 session_name=None, cache_file="candidate_cache.json", segment_time=None, collect_metrics=True,
+                 metrics_textfile=None, adaptive=False, min_fps=10, spill_limit_mb=None, spill_dir=None):
         # Initialize the main class with recording duration and other parameters
         self.recording_duration = recording_duration  # Duration for the video recording
+        self.session_name = session_name  # Set when several sessions run side by side
+        self.output_folder = output_folder  # Where this session's recordings go
+        self.audio_source = audio_source  # Source recorded for this session, e.g. a sink monitor (None: default)
+        self.profile_dir = os.path.join("browser_profiles", session_name) if session_name else "browser_profiles"
         self.min_video_duration = 120  # Minimum duration of video to be recorded (in seconds)
         self.setup_logging()  # Set up logging configuration
         self.driver = None  # Placeholder for Selenium WebDriver instance
         self.recording_thread = None  # Thread for recording video
+        self.recording_finished = threading.Event()  # Set when the current job's recording has been saved
         self.should_stop = False  # Flag to stop recording
         self.target_fps = 30  # Target frames per second for the recording
-        self.recording = Recording(recording_duration)  # Initialize Recording object
-        self.selenium = Selenium(recording_duration)  # Initialize Selenium automation object
+        self.capture_scale = capture_scale  # Downscale factor for the recorded frames
+        self.adaptive = adaptive  # Trade quality for a steady frame rate under load
+        self.min_fps = min_fps  # Lower bound for the adaptive frame rate
+        self.spill_limit_mb = spill_limit_mb  # RAM for frames waiting on the encoder before they spill to disk
+        self.spill_dir = spill_dir  # Local directory for the spill files
+        self.segment_time = segment_time  # Length of the crash-safe output segments (None: single files)
+        self.recording = None  # Recording object for the current job
+        self.selenium = None  # Selenium automation object for the current job
+        self.cache = CandidateCache(cache_file) if cache_file else None  # Search results shared between runs
+        self.collect_metrics = collect_metrics  # Write per-session metrics next to each recording
+        self.metrics_textfile = metrics_textfile  # Optional Prometheus textfile updated after each session
+        self.metrics = NULL_METRICS  # Metrics of the current job
+        self.first_frame_reported = False  # The startup time is only meaningful for the first job
 
         # Log the initial setup information
         logging.info("Starting New Recording Session")
@@ -32,7 +56,8 @@ class Main:
 
         # Create a timestamped log file name
         timestamp = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
-        log_file = f'logs/youtube_recorder_{timestamp}.log'
+        suffix = f'_{self.session_name}' if self.session_name else ''
+        log_file = f'logs/youtube_recorder_{timestamp}{suffix}.log'
 
         # Configure logging to output to both console and file
         logging.basicConfig(
@@ -49,28 +74,91 @@ class Main:
         logging.info(f"Recording duration set to: {self.recording_duration} seconds")
         logging.info(f"Minimum video duration set to: {self.min_video_duration} seconds")
 
+    def prepare_session(self, driver=None, microphone=None):
+        # Create the recorder and the browser automation for one job; a warm driver is reused if given
+        from Recording import Recording
+        from Selenium import Selenium
+        self.metrics = Metrics() if self.collect_metrics or self.metrics_textfile else NULL_METRICS
+        self.recording = Recording(self.recording_duration, scale=self.capture_scale,
+                                   output_folder=self.output_folder, audio_source=self.audio_source,
+                                   db_file=os.path.join(self.output_folder, "Average_dB.txt")
+                                   if self.session_name else None,
+                                   segment_time=self.segment_time, microphone=microphone,
+                                   adaptive=self.adaptive, min_fps=self.min_fps,
+                                   spill_limit_mb=self.spill_limit_mb, spill_dir=self.spill_dir,
+                                   metrics=self.metrics)  # Initialize Recording object
+        with self.metrics.phase("browser launch"):
+            self.selenium = Selenium(self.recording_duration, driver=driver, cache=self.cache,
+                                     metrics=self.metrics)  # Initialize Selenium automation object
+        self.recording_thread = None
+        self.recording_finished = threading.Event()
+
+    def start_recording(self, player_rect):
+        # Start recording the player region (or the whole screen if it is unknown) in a separate thread
+        self.recording.region = player_rect
+        self.recording_thread = threading.Thread(target=self.record)
+        self.recording_thread.start()  # Begin recording in the background
+        logging.info("Recording thread started")
+
+    def record(self):
+        # Recording thread: tell the browser side when the recording is over, however it ended
+        try:
+            self.recording.record_screen()
+        finally:
+            self.recording_finished.set()
+
+    def save_metrics(self):
+        # Write the job's metrics next to its recording and refresh the Prometheus textfile
+        if not self.metrics.enabled:
+            return
+        try:
+            if self.collect_metrics:
+                session_id = (self.recording and self.recording.session_id) or datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
+                os.makedirs(self.output_folder, exist_ok=True)
+                metrics_file = os.path.join(self.output_folder, f"Recording_{session_id}_metrics.json")
+                self.metrics.save_json(metrics_file)
+                logging.info(f"Session metrics saved to {metrics_file}")
+            if self.metrics_textfile:
+                self.metrics.save_prometheus(self.metrics_textfile, {"session": self.session_name or "main"})
+        except Exception as e:
+            logging.warning(f"Could not save session metrics: {str(e)}")
+
+    def report_first_frame(self):
+        # Startup cost as the user sees it: from process start to the first grabbed frame (first job only)
+        if self.first_frame_reported or self.recording.first_frame_time is None:
+            return
+        self.first_frame_reported = True
+        startup = self.recording.first_frame_time - PROCESS_START
+        self.metrics.record_phase("process start to first frame", startup)
+        logging.info(f"Time from process start to first frame: {startup:.2f} s")
+
     def run(self):
+        run_start = time.perf_counter()
         try:
             logging.info("Starting...")
+            preflight = Preflight(audio_source=self.audio_source)
+            if self.selenium is None:
+                # Launch the browser while the connection is checked and the audio device is opened
+                connected, microphone, _ = preflight.run(self.prepare_session)
+                self.recording.microphone = microphone
+            else:
+                connected = preflight.timed("connectivity check", preflight.connectivity)
+            for name, seconds in preflight.timings.items():
+                self.metrics.record_phase(f"preflight: {name}", seconds)
 
             # Check if there is an active internet connection
-            if not self.selenium.check_internet_connection():
-                logging.error("No internet connection detected.")  # Log error if no connection
-                logging.info("Waiting for 15 seconds before shutting down...")
-                time.sleep(15)  # Wait for 15 seconds before rechecking the connection
-                if not self.selenium.check_internet_connection():
-                    logging.error("Exiting due to lack of internet connection.")  # Exit if no connection
-                    return
-                logging.info("Internet connection detected. Resuming...")  # If internet is back, continue
-
-            # Start recording in a separate thread
-            self.recording_thread = threading.Thread(target=self.recording.record_screen)
-            self.recording_thread.start()  # Begin recording in the background
-            logging.info("Recording thread started")
+            if not connected:
+                logging.error("Exiting due to lack of internet connection.")  # Exit if no connection
+                if self.selenium.owns_driver:
+                    self.selenium.driver.quit()
+                return
 
             try:
-                # Run Selenium automation to find and play a YouTube video
-                self.selenium.run()
+                # Run Selenium automation to find and play a YouTube video, recording once playback starts
+                with self.metrics.phase("automation"):
+                    # The browser stays open until the recording is saved, so its tail never shows the browser closing
+                    self.selenium.run(on_playback=self.start_recording, on_ad=self.recording.ad_event,
+                                      recording_finished=self.recording_finished)
             finally:
                 # Ensure that the browser is closed after the Selenium task
                 if self.driver:
@@ -79,16 +167,62 @@ class Main:
                     self.driver = None  # Reset WebDriver reference
 
             # Wait for the recording to finish
-            logging.info("Waiting for recording to complete")
-            self.recording_thread.join()  # Wait for the recording thread to finish
-            logging.info("Recording thread completed")
+            if self.recording_thread:
+                logging.info("Waiting for recording to complete")
+                with self.metrics.phase("recording wait"):
+                    self.recording_thread.join()  # Wait for the recording thread to finish
+                logging.info("Recording thread completed")
+                self.report_first_frame()
+            else:
+                logging.error("Playback never started, nothing was recorded")
 
         finally:
             # Log session completion
+            self.selenium = None
+            self.metrics.record_phase("total", time.perf_counter() - run_start)
+            self.save_metrics()
             logging.info("C'est fini.")
 
+    def run_batch(self, count, pool_size=1, max_uses=20):
+        # Record several videos in one process, reusing warm browsers between jobs
+        from BrowserPool import BrowserPool
+        pool = BrowserPool(size=pool_size, max_uses=max_uses, profile_dir=self.profile_dir)
+        try:
+            for job in range(1, count + 1):
+                logging.info(f"=== Batch job {job}/{count} ===")
+                session = pool.acquire()
+                try:
+                    self.prepare_session(driver=session.driver)
+                    self.run()
+                finally:
+                    pool.release(session)
+        finally:
+            pool.close()
+
 
 if __name__ == "__main__":
-    # Initialize and run the main program with a 70-second recording duration
-    main = Main(recording_duration=70)
-    main.run()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Record YouTube music videos")
+    parser.add_argument("--duration", type=float, default=70, help="recording duration in seconds")
+    parser.add_argument("--batch", type=int, default=0, help="record this many videos in one process")
+    parser.add_argument("--no-cache", action="store_true", help="always load the search page")
+    parser.add_argument("--segment", type=float, default=None,
+                        help="write the recording in segments of this many seconds")
+    parser.add_argument("--no-metrics", action="store_true", help="do not write per-session metrics files")
+    parser.add_argument("--metrics-textfile", help="also write metrics to this Prometheus textfile")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="lower scaling quality and frame rate when the machine cannot keep up")
+    parser.add_argument("--min-fps", type=float, default=10, help="lowest frame rate --adaptive may use")
+    parser.add_argument("--spill-limit-mb", type=float, default=None,
+                        help="keep at most this many MB of frames queued for the encoder and spill the rest to disk")
+    parser.add_argument("--spill-dir", help="local directory for spilled frames (default: the system temp directory)")
+    args = parser.parse_args()
+
+    # Initialize and run the main program with a 70-second recording duration by default
+    main = Main(recording_duration=args.duration, cache_file=None if args.no_cache else "candidate_cache.json",
+                segment_time=args.segment, collect_metrics=not args.no_metrics,
+                metrics_textfile=args.metrics_textfile, adaptive=args.adaptive, min_fps=args.min_fps,
+                spill_limit_mb=args.spill_limit_mb, spill_dir=args.spill_dir)
+    if args.batch:
+        main.run_batch(args.batch)
+    else:
+        main.run()
\ No newline at end of file
@@ -0,0 +1,77 @@
+import struct
+
+
+def ebml_id(element_id):
+    # Element IDs are written with their length marker already included
+    return element_id.to_bytes((element_id.bit_length() + 7) // 8, 'big')
+
+
+def ebml_size(size):
+    # Encode a data size as an EBML variable-length integer
+    for length in range(1, 9):
+        if size < (1 << (7 * length)) - 1:
+            return (size | (1 << (7 * length))).to_bytes(length, 'big')
+    raise ValueError(f"EBML size too large: {size}")
+
+
+def ebml_element(element_id, data):
+    # Build a complete element from its ID and payload
+    if isinstance(data, int):
+        data = data.to_bytes(max(1, (data.bit_length() + 7) // 8), 'big')
+    elif isinstance(data, str):
+        data = data.encode()
+    return ebml_id(element_id) + ebml_size(len(data)) + data
+
+
+UNKNOWN_SIZE = b'\x01\xff\xff\xff\xff\xff\xff\xff'  # Size of elements streamed without knowing their length
+
+
+class MatroskaWriter:
+    CLUSTER_SPAN = 5000  # Start a new cluster every few seconds (block offsets are 16-bit)
+
+    def __init__(self, stream, width, height):
+        # Stream raw BGR frames with their own timestamps (milliseconds) as a live Matroska file
+        self.stream = stream
+        self.width = width
+        self.height = height
+        self.cluster_start = None  # Timestamp of the current cluster
+
+    def write_header(self):
+        # EBML header, an unknown-size segment and a single uncompressed BGR video track
+        header = ebml_element(0x1A45DFA3, b''.join([
+            ebml_element(0x4286, 1),  # EBMLVersion
+            ebml_element(0x42F7, 1),  # EBMLReadVersion
+            ebml_element(0x42F2, 4),  # EBMLMaxIDLength
+            ebml_element(0x42F3, 8),  # EBMLMaxSizeLength
+            ebml_element(0x4282, "matroska"),  # DocType
+            ebml_element(0x4287, 4),  # DocTypeVersion
+            ebml_element(0x4285, 2),  # DocTypeReadVersion
+        ]))
+        info = ebml_element(0x1549A966, b''.join([
+            ebml_element(0x2AD7B1, 1000000),  # TimestampScale: 1 ms
+            ebml_element(0x4D80, "Recording"),  # MuxingApp
+            ebml_element(0x5741, "Recording"),  # WritingApp
+        ]))
+        tracks = ebml_element(0x1654AE6B, ebml_element(0xAE, b''.join([
+            ebml_element(0xD7, 1),  # TrackNumber
+            ebml_element(0x73C5, 1),  # TrackUID
+            ebml_element(0x83, 1),  # TrackType: video
+            ebml_element(0x86, "V_UNCOMPRESSED"),  # CodecID
+            ebml_element(0xE0, b''.join([
+                ebml_element(0xB0, self.width),  # PixelWidth
+                ebml_element(0xBA, self.height),  # PixelHeight
+                ebml_element(0x2EB524, b'BGR\x18'),  # ColourSpace: packed 24-bit BGR
+            ])),
+        ])))
+        self.stream.write(header + ebml_id(0x18538067) + UNKNOWN_SIZE + info + tracks)
+
+    def write_frame(self, timestamp, frame):
+        # Write one frame as a keyframe SimpleBlock at the given timestamp in milliseconds
+        timestamp = int(timestamp)
+        if self.cluster_start is None or timestamp - self.cluster_start >= self.CLUSTER_SPAN:
+            self.cluster_start = timestamp
+            self.stream.write(ebml_id(0x1F43B675) + UNKNOWN_SIZE + ebml_element(0xE7, timestamp))
+        data = frame.data
+        block_header = b'\x81' + struct.pack('>hB', timestamp - self.cluster_start, 0x80)
+        self.stream.write(ebml_id(0xA3) + ebml_size(len(block_header) + data.nbytes) + block_header)
+        self.stream.write(data)
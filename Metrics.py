@@ -0,0 +1,232 @@
+import bisect
+import json
+import os
+import time
+
+# Bucket upper bounds: latencies in seconds, queue depths in items
+LATENCY_BOUNDS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0, 10.0)
+DEPTH_BOUNDS = (0, 1, 2, 3, 4, 6, 8, 12, 16, 32, 64)
+
+
+class Histogram:
+    def __init__(self, bounds=LATENCY_BOUNDS):
+        # Fixed buckets, so observing is a bisect and an increment no matter how long the session runs
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # The last bucket catches everything above the largest bound
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q-th quantile (the maximum for the overflow bucket)
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else None,
+            "min": self.min,
+            "max": self.max,
+            "p50": self.quantile(0.5),
+            "p99": self.quantile(0.99),
+            "buckets": {str(bound): count for bound, count in zip(self.bounds + ("+Inf",), self.counts)},
+        }
+
+
+class NullTimer:
+    # Shared do-nothing context manager handed out when metrics are disabled
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+class Timer:
+    def __init__(self, metrics, name, label, phase):
+        self.metrics = metrics
+        self.name = name
+        self.label = label
+        self.phase = phase  # Record as a one-off phase duration instead of a histogram sample
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        if self.phase:
+            self.metrics.record_phase(self.name, elapsed)
+        else:
+            self.metrics.observe(self.name, elapsed, label=self.label)
+
+
+class NullMetrics:
+    # Same interface as Metrics with every call a no-op, so instrumented code never checks a flag
+    enabled = False
+    TIMER = NullTimer()
+
+    def observe(self, name, value, label=None, bounds=LATENCY_BOUNDS):
+        pass
+
+    def count(self, name, value=1, label=None):
+        pass
+
+    def set(self, name, value, label=None):
+        pass
+
+    def record_phase(self, name, seconds):
+        pass
+
+    def timer(self, name, label=None):
+        return self.TIMER
+
+    def phase(self, name):
+        return self.TIMER
+
+    def instrument_driver(self, driver):
+        pass
+
+
+class Metrics(NullMetrics):
+    enabled = True
+    LABELS = {"webdriver_seconds": "command", "queue_depth": "queue"}  # Prometheus label names (default: stage)
+
+    def __init__(self, prefix="recorder"):
+        # Per-session histograms, counters, gauges and phase timings; written as JSON or a Prometheus textfile
+        self.prefix = prefix  # Prefix of the Prometheus metric names
+        self.histograms = {}  # (name, label) -> Histogram
+        self.counters = {}  # (name, label) -> total
+        self.gauges = {}  # (name, label) -> last value
+        self.phases = {}  # name -> seconds, in the order the phases finished
+        self.started = time.time()
+
+    def observe(self, name, value, label=None, bounds=LATENCY_BOUNDS):
+        key = (name, label)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms.setdefault(key, Histogram(bounds))
+        histogram.observe(value)
+
+    def count(self, name, value=1, label=None):
+        key = (name, label)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, label=None):
+        self.gauges[(name, label)] = value
+
+    def record_phase(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def timer(self, name, label=None):
+        # `with metrics.timer("convert"):` adds the block's duration to a latency histogram
+        return Timer(self, name, label, phase=False)
+
+    def phase(self, name):
+        # `with metrics.phase("search"):` records how long a one-off phase took
+        return Timer(self, name, None, phase=True)
+
+    def instrument_driver(self, driver):
+        # Count and time every WebDriver command by wrapping the driver's single command entry point;
+        # a pooled driver handed to a new session is re-wrapped around the original method
+        execute = getattr(driver, "untimed_execute", driver.execute)
+        driver.untimed_execute = execute
+
+        def timed_execute(command, params=None):
+            start = time.perf_counter()
+            try:
+                return execute(command, params)
+            finally:
+                self.observe("webdriver_seconds", time.perf_counter() - start, label=command)
+
+        driver.execute = timed_execute
+
+    def label_pair(self, name, label):
+        return {self.LABELS.get(name, "stage"): label} if label is not None else {}
+
+    @staticmethod
+    def key_name(name, label):
+        return f"{name}[{label}]" if label is not None else name
+
+    def to_dict(self):
+        return {
+            "started": self.started,
+            "phases": self.phases,
+            "counters": {self.key_name(*key): value for key, value in sorted(self.counters.items(), key=str)},
+            "gauges": {self.key_name(*key): value for key, value in sorted(self.gauges.items(), key=str)},
+            "histograms": {self.key_name(*key): histogram.to_dict()
+                           for key, histogram in sorted(self.histograms.items(), key=str)},
+        }
+
+    def save_json(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def prometheus(self, labels=None):
+        # Render everything in the Prometheus text exposition format
+        base = dict(labels or {})
+
+        def series(name, extra=None):
+            pairs = dict(base, **(extra or {}))
+            if not pairs:
+                return name
+            return name + "{" + ",".join(f'{k}="{v}"' for k, v in pairs.items()) + "}"
+
+        lines = []
+        typed = set()
+        for (name, label), histogram in sorted(self.histograms.items(), key=str):
+            metric = f"{self.prefix}_{name}"
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} histogram")
+                typed.add(metric)
+            extra = self.label_pair(name, label)
+            cumulative = 0
+            for bound, count in zip(histogram.bounds + ("+Inf",), histogram.counts):
+                cumulative += count
+                lines.append(f"{series(metric + '_bucket', dict(extra, le=str(bound)))} {cumulative}")
+            lines.append(f"{series(metric + '_sum', extra)} {histogram.sum}")
+            lines.append(f"{series(metric + '_count', extra)} {histogram.count}")
+        for kind, values, suffix in (("counter", self.counters, "_total"), ("gauge", self.gauges, "")):
+            for (name, label), value in sorted(values.items(), key=str):
+                metric = f"{self.prefix}_{name}{suffix}"
+                if metric not in typed:
+                    lines.append(f"# TYPE {metric} {kind}")
+                    typed.add(metric)
+                lines.append(f"{series(metric, self.label_pair(name, label))} {value}")
+        for name, seconds in self.phases.items():
+            metric = f"{self.prefix}_phase_seconds"
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} gauge")
+                typed.add(metric)
+            lines.append(f"{series(metric, {'phase': name})} {seconds}")
+        return "\n".join(lines) + "\n"
+
+    def save_prometheus(self, path, labels=None):
+        # Write atomically so the node_exporter textfile collector never reads a partial file
+        temp = f"{path}.{os.getpid()}.tmp"
+        with open(temp, "w") as f:
+            f.write(self.prometheus(labels))
+        os.replace(temp, path)
+
+
+NULL_METRICS = NullMetrics()
@@ -0,0 +1,150 @@
+import logging
+import threading
+import time
+import mss
+from StageQueue import StageQueue
+from Metrics import NULL_METRICS, DEPTH_BOUNDS
+
+
+class Pipeline:
+    def __init__(self, screen, fps, ring, encoder, queue_size=4, policy='drop_oldest', detector=None,
+                 screen_source=None, metrics=NULL_METRICS, controller=None):
+        # Capture -> convert -> encode stages connected by bounded queues
+        self.screen = screen  # Region to grab, in mss monitor format
+        self.fps = fps
+        self.ring = ring  # Preallocated slots the convert stage writes into
+        self.encoder = encoder  # Encoder whose queue is the input of the encode stage
+        self.detector = detector  # Optional ChangeDetector that skips frames identical to the previous one
+        self.screen_source = screen_source or mss.mss  # Factory for the grabber (mss, or a stand-in for benchmarks)
+        self.metrics = metrics  # Per-stage latency histograms and queue depths (no-op unless enabled)
+        self.controller = controller  # Optional AdaptiveController trading quality for a steady frame rate
+        self.convert_queue = StageQueue('convert', queue_size, policy)
+        self.captured = 0  # Frames grabbed by the capture stage
+        self.missed = 0  # Capture ticks skipped because the grab ran late
+        self.duplicates = 0  # Frames skipped because nothing changed on screen
+        self.converted = 0  # Frames converted into ring slots
+        self.grab_time = 0.0  # Total seconds spent grabbing and converting, for the adaptive controller
+        self.convert_time = 0.0
+        self.start_time = None
+        self.end_time = None
+        self.first_frame_time = None  # time.perf_counter() of the first grab
+        self.error = None
+
+    def run(self, duration, stop_event, clock_origin=None):
+        # Run all stages until the duration elapses or the stop event is set, then drain them;
+        # frames are stamped in seconds since clock_origin (a time.perf_counter() value)
+        convert_thread = threading.Thread(target=self._convert, name="convert")
+        convert_thread.start()
+        try:
+            self._capture(duration, stop_event, clock_origin)
+        finally:
+            self.convert_queue.close()
+            convert_thread.join()
+        if self.error:
+            raise RuntimeError(self.error)
+
+    def _capture(self, duration, stop_event, clock_origin):
+        # Grab frames on a fixed schedule; a slow grab never delays the following ticks
+        sct = self.screen_source()
+        period = 1.0 / self.fps
+        tick = 0
+        self.start_time = time.perf_counter()
+        anchor = self.start_time  # Tick 0 of the current schedule; moved when the frame rate changes
+        if clock_origin is None:
+            clock_origin = self.start_time
+        logging.info("Screen recording started.")
+        try:
+            while not stop_event.is_set() and not self.error:
+                deadline = anchor + tick * period
+                now = time.perf_counter()
+                if deadline - self.start_time >= duration:
+                    break
+                if deadline > now:
+                    stop_event.wait(deadline - now)  # Sleep until the next tick unless told to stop
+                    continue
+
+                grabbed = time.perf_counter()
+                timestamp = grabbed - clock_origin
+                img = sct.grab(self.screen)
+                if self.first_frame_time is None:
+                    self.first_frame_time = grabbed
+                grab_time = time.perf_counter() - grabbed
+                self.grab_time += grab_time
+                self.metrics.observe('grab_seconds', grab_time)
+                self.convert_queue.put((timestamp, img))
+                self.metrics.observe('queue_depth', len(self.convert_queue), label='convert', bounds=DEPTH_BOUNDS)
+                self.captured += 1
+                tick += 1
+
+                # Skip the ticks that have already passed so the schedule stays anchored to the start time
+                behind = int((time.perf_counter() - anchor) / period) - tick
+                if behind > 0:
+                    self.missed += behind
+                    tick += behind
+
+                level = self.controller.update(self, timestamp) if self.controller else None
+                if level:
+                    # Apply the new rung: the convert stage picks up the filter, the schedule restarts at the new rate
+                    self.ring.interpolation = level.interpolation
+                    anchor += tick * period
+                    tick = 0
+                    period = 1.0 / level.fps
+                    self.metrics.set('capture_fps', level.fps)
+        finally:
+            self.end_time = time.perf_counter()
+            sct.close()
+
+    def _convert(self):
+        # Convert grabbed screenshots into ring slots and pass them to the encoder
+        duplicate = None  # Latest skipped duplicate, written at the end so the video lasts until the last grab
+        while True:
+            item = self.convert_queue.get()
+            if item is None:
+                if duplicate:
+                    self._encode(*duplicate)
+                break
+            timestamp, img = item
+            if self.detector:
+                with self.metrics.timer('detect_seconds'):
+                    changed = self.detector.changed(img, timestamp)
+                if not changed:
+                    self.duplicates += 1
+                    duplicate = item
+                    continue
+            duplicate = None
+            if not self._encode(timestamp, img):
+                break
+        # Keep draining so the capture stage is never blocked by a dead converter
+        while self.convert_queue.get() is not None:
+            pass
+
+    def _encode(self, timestamp, img):
+        # Convert one screenshot into a ring slot and queue it for encoding; returns False on failure
+        try:
+            started = time.perf_counter()
+            slot = self.ring.convert(img, timestamp=timestamp)
+            convert_time = time.perf_counter() - started
+            self.convert_time += convert_time
+            self.converted += 1
+            self.metrics.observe('convert_seconds', convert_time)
+            self.encoder.write(slot)
+            self.metrics.observe('queue_depth', len(self.encoder.frames), label='encode', bounds=DEPTH_BOUNDS)
+            return True
+        except Exception as e:
+            self.error = f"Convert stage failed: {str(e)}"
+            logging.error(self.error)
+            return False
+
+    def summary(self):
+        # Per-stage frame counts for the session report
+        return {
+            "captured": self.captured,
+            "missed_ticks": self.missed,
+            "duplicates_skipped": self.duplicates,
+            "dropped_convert": self.convert_queue.dropped,
+            "dropped_encode": self.encoder.frames.dropped,
+            "encoded": self.encoder.frame_count,
+            "max_depth_convert": self.convert_queue.max_depth,
+            "max_depth_encode": self.encoder.frames.max_depth,
+            "spilled": getattr(self.encoder.frames, 'spilled', 0),
+        }
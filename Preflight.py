@@ -0,0 +1,59 @@
+import logging
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def check_connection(host="8.8.8.8", port=53, timeout=3, attempts=1, backoff=1.0):
+    # Try to open a TCP connection, retrying with exponential backoff; the socket is always closed
+    delay = backoff
+    for attempt in range(1, attempts + 1):
+        try:
+            with socket.create_connection((host, port), timeout=timeout):
+                return True
+        except OSError as e:
+            logging.error(f"Internet connection check failed (attempt {attempt}/{attempts}): {str(e)}")
+        if attempt < attempts:
+            time.sleep(delay)
+            delay *= 2
+    return False
+
+
+class Preflight:
+    def __init__(self, audio_source=None, attempts=5, backoff=0.5):
+        # Startup checks run side by side so the slowest one, not their sum, sets the time to first frame
+        self.audio_source = audio_source  # Speaker name or exact source id to record; None: default speaker
+        self.attempts = attempts  # Connectivity attempts; waits backoff, 2x backoff, ... between them
+        self.backoff = backoff
+        self.timings = {}  # Duration of each task in seconds
+
+    def timed(self, name, task):
+        start = time.perf_counter()
+        try:
+            return task()
+        finally:
+            self.timings[name] = time.perf_counter() - start
+
+    def connectivity(self):
+        return check_connection(attempts=self.attempts, backoff=self.backoff)
+
+    def open_audio(self):
+        # Connect to the sound server and resolve the loopback device ahead of the recording;
+        # returns None if it fails, in which case the recorder tries again when it starts
+        try:
+            import soundcard as sc
+            return sc.get_microphone(id=str(self.audio_source or sc.default_speaker().name), include_loopback=True)
+        except Exception as e:
+            logging.warning(f"Could not open the audio device during preflight: {str(e)}")
+            return None
+
+    def run(self, launch_browser):
+        # Run the connectivity check, the audio device lookup and launch_browser() concurrently;
+        # returns (connected, microphone, result of launch_browser)
+        with ThreadPoolExecutor(max_workers=3, thread_name_prefix="preflight") as pool:
+            connected = pool.submit(self.timed, "connectivity check", self.connectivity)
+            microphone = pool.submit(self.timed, "audio device", self.open_audio)
+            browser = pool.submit(self.timed, "browser launch", launch_browser)
+            results = connected.result(), microphone.result(), browser.result()
+        logging.info("Preflight: " + ", ".join(f"{name} {seconds:.2f} s" for name, seconds in self.timings.items()))
+        return results
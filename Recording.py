@@ -1,24 +1,117 @@
+import json
 import logging
+import math
 import threading
-import numpy as np
 import mss
-import cv2
 import os
-import soundcard as sc
-import soundfile as sf
-from concurrent.futures import ThreadPoolExecutor
 import warnings
-from moviepy.editor import ImageSequenceClip, AudioFileClip
 import time
+from AudioRecorder import AudioRecorder
+from Loudness import LoudnessMeter
+from Encoder import Encoder
+from FrameRing import FrameRing
+from Pipeline import Pipeline
+from ChangeDetector import ChangeDetector
+from Metrics import NULL_METRICS
+from Adaptive import AdaptiveController
 
 class Recording:
 
-    def __init__(self, recording_duration):
-        # Initialize with the specified recording duration
+    def __init__(self, recording_duration, target_fps=30, queue_size=4, overload_policy='drop_oldest', scale=1.0,
+                 detect_duplicates=True, output_folder="Recording", audio_source=None, db_file=None,
+                 segment_time=None, screen_source=None, microphone=None, metrics=NULL_METRICS, adaptive=False,
+                 min_fps=10, spill_limit_mb=None, spill_dir=None):
+        # Initialize with the specified recording duration and capture pipeline settings
         self.recording_duration = recording_duration
+        self.output_folder = output_folder  # Where the recording, its report and intermediates are written
+        self.audio_source = audio_source  # Speaker name or exact source id to record; None: default speaker
+        self.db_file = db_file or os.path.join(os.getcwd(), "Average_dB.txt")  # Average level output
+        self.region = None  # Screen rectangle to grab (e.g. the video player); None grabs the whole monitor
+        self.ad_intervals = []  # [start, end] of ads reported by the browser, in time.perf_counter() seconds
+        self.scale = scale  # Downscale factor applied in the convert stage before encoding
+        self.target_fps = target_fps  # Target frame rate for video recording
+        self.queue_size = queue_size  # Frames each pipeline queue can hold
+        self.overload_policy = overload_policy  # 'drop_oldest', 'drop_newest' or 'block' when a stage falls behind
+        self.detect_duplicates = detect_duplicates  # Skip unchanged frames and write variable frame rate video
+        self.segment_time = segment_time  # Write audio and video in segments of this many seconds (None: single files)
+        self.screen_source = screen_source or mss.mss  # Screen grabber factory; benchmarks plug in a synthetic one
+        self.microphone = microphone  # Audio recorder replacing the loopback device (None: sound card)
+        self.metrics = metrics  # Stage latencies, queue depths and drops for the session
+        self.adaptive = adaptive  # Lower the downscaling quality or the frame rate, whichever relieves the bottleneck
+        self.min_fps = min_fps  # Lowest frame rate the adaptive controller may go down to
+        self.spill_limit_mb = spill_limit_mb  # RAM for queued encoder frames; the excess spills to disk (None: drop)
+        self.spill_dir = spill_dir  # Local directory for the spill files (None: the system temp directory)
+        self.session_id = None  # Timestamp naming the files of the last recording
+        self.first_frame_time = None  # time.perf_counter() of the first grabbed frame
+
+    def ad_event(self, kind, timestamp):
+        # Receive ad events from the browser so the ad ranges can be marked in the recording
+        if kind == 'ad_start':
+            self.ad_intervals.append([timestamp, None])
+        elif kind == 'ad_end' and self.ad_intervals and self.ad_intervals[-1][1] is None:
+            self.ad_intervals[-1][1] = timestamp
+
+    def ad_chapters(self, video_start, video_duration):
+        # Split the recording into video/advertisement chapters (seconds from the first frame)
+        chapters = []
+        position = 0.0
+        for start, end in self.ad_intervals:
+            start = max(start - video_start, 0.0)
+            end = video_duration if end is None else min(end - video_start, video_duration)
+            if end <= start or start >= video_duration:
+                continue
+            if start > position:
+                chapters.append((position, start, "Video"))
+            chapters.append((start, end, "Advertisement"))
+            position = end
+        if chapters and position < video_duration:
+            chapters.append((position, video_duration, "Video"))
+        return chapters
+
+    def capture_region(self, monitors):
+        # Clip the requested region to the screen, falling back to the primary monitor
+        monitor = monitors[1]
+        if not self.region:
+            return monitor
+        bounds = monitors[0]  # Bounding box of all monitors
+        left = max(int(self.region["left"]), bounds["left"])
+        top = max(int(self.region["top"]), bounds["top"])
+        right = min(int(self.region["left"] + self.region["width"]), bounds["left"] + bounds["width"])
+        bottom = min(int(self.region["top"] + self.region["height"]), bounds["top"] + bounds["height"])
+        width = (right - left) // 2 * 2  # H.264 needs even dimensions
+        height = (bottom - top) // 2 * 2
+        if width < 2 or height < 2:
+            logging.warning(f"Capture region {self.region} is off screen, recording the whole monitor")
+            return monitor
+        return {"left": left, "top": top, "width": width, "height": height}
+
+    def save_loudness(self, meter, current_time_str, output_folder, report):
+        # Save the per-second loudness timeline and the overall average level
+        db_level = meter.average_db()
+        logging.info(f"Average sound level: {db_level:.2f} dB")
+        for start, end in meter.silent_stretches:
+            logging.info(f"Silent stretch from {start:g} s to {end:g} s")
+
+        timeline_file = os.path.join(output_folder, f"Recording_{current_time_str}_loudness.csv")
+        meter.save_csv(timeline_file)
+        logging.info(f"Loudness timeline saved to: {timeline_file}")
+
+        # Write the dB level to a file
+        db_file = self.db_file
+        with open(db_file, 'w') as f:
+            f.write(f"Average Sound Level: {db_level:.2f} dB\n")
+        logging.info(f"Average sound level saved to: {db_file}")
+
+        report["loudness"] = {
+            "average_db": db_level if math.isfinite(db_level) else None,  # Silent or no audio: JSON has no -inf
+            "timeline": timeline_file,
+            "silent_stretches": meter.silent_stretches,
+        }
 
     def record_screen(self):
-        OUTPUT_FOLDER = "Recording"  # Output folder for the recording
+        OUTPUT_FOLDER = self.output_folder  # Output folder for the recording
+        current_time_str = time.strftime("%Y-%m-%d_%H-%M-%S", time.localtime())  # Names the session's files
+        self.session_id = current_time_str
 
         # Log the setup of screen recording
         logging.info("Initializing screen recording setup.")
@@ -35,183 +128,165 @@ class Recording:
             logging.info(f"Created output folder at {OUTPUT_FOLDER}")
 
         # Setup for screen capture using mss (multi-screen screenshot library)
-        sct = mss.mss()
-        screen = sct.monitors[1]  # Set the screen to record from (e.g., primary monitor)
-        frames = []  # List to store captured frames
-        logging.debug(f"Screen dimensions set to {screen}.")
-
-        # Synchronization variables for audio and video recording
+        with self.screen_source() as sct:
+            screen = self.capture_region(sct.monitors)  # Player region, or the primary monitor
+        logging.info(f"Capture region set to {screen}.")
+
+        # Size of the encoded frames after the optional downscale (H.264 needs even dimensions)
+        width = max(2, int(screen["width"] * self.scale) // 2 * 2)
+        height = max(2, int(screen["height"] * self.scale) // 2 * 2)
+        if (width, height) != (screen["width"], screen["height"]):
+            logging.info(f"Downscaling frames to {width}x{height}")
+
+        # Frames are streamed into a long-running encoder instead of being kept in memory
+        target_fps = self.target_fps
+        # Intermediates carry the session timestamp, so segments kept after a failure survive the next run
+        video_file = os.path.join(OUTPUT_FOLDER, f"Recording_{current_time_str}_video.mp4")
+        encoder = Encoder(video_file, width, height, target_fps,
+                          queue_size=self.queue_size, policy=self.overload_policy, segment_time=self.segment_time,
+                          metrics=self.metrics,
+                          memory_limit=self.spill_limit_mb and int(self.spill_limit_mb * 1024 * 1024),
+                          spill_dir=self.spill_dir)
+        encoder.start()
+
+        # Preallocated frame slots: one per queued frame plus the ones being converted and encoded
+        ring = FrameRing(width, height, slots=encoder.frames.maxsize + 2)
+
+        # Audio chunks and video frames are stamped against the same monotonic clock
         sync_event = threading.Event()
-        audio_delay = 1.5  # Audio delay compensation to sync video and audio
-
-        # Function to save each frame to disk
-        def save_frame(i, frame, frames_dir):
-            frame_path = os.path.join(frames_dir, f"frame_{i:04d}.png")
-            cv2.imwrite(frame_path, frame)  # Save the frame as an image
-            logging.debug(f"Saved frame {i} to {frame_path}")
-
-        # Function to record audio in chunks and save it to a file
-        def record_audio(output_file=os.path.join(OUTPUT_FOLDER, "audio.mp3"), record_sec=self.recording_duration,
-                         sample_rate=44100):
-            data = []  # List to store audio data chunks
-
-            # Use soundcard library to record audio from the default microphone
-            with sc.get_microphone(id=str(sc.default_speaker().name), include_loopback=True).recorder(
-                    samplerate=sample_rate) as mic:
-                sync_event.set()  # Signal that audio recording is ready to start
-
-                chunk_duration = 0.05  # 50ms chunks for better sync with video
-                chunk_samples = int(sample_rate * chunk_duration)
-                num_chunks = int(record_sec / chunk_duration)
-
-                for _ in range(num_chunks):
-                    if stop_recording.is_set():
-                        logging.warning("Audio recording stopped early due to stop signal.")
-                        break
-                    chunk = mic.record(numframes=chunk_samples)  # Record a chunk of audio
-                    data.append(chunk[:, 0])  # Append the chunk to the data list
-
-            # Process the recorded audio (concatenate chunks and pad if needed)
-            full_data = np.concatenate(data)
-            target_samples = int(record_sec * sample_rate)
-
-            if len(full_data) > target_samples:
-                full_data = full_data[:target_samples]  # Trim excess audio
-            elif len(full_data) < target_samples:
-                full_data = np.pad(full_data, (0, target_samples - len(full_data)))  # Pad audio if too short
-
-            # Save the processed audio to file
-            sf.write(file=output_file, data=full_data, samplerate=sample_rate)
-            logging.info(f"Audio recording saved to {output_file}")
-
-            # Calculate and log the RMS and dB level of the audio
-            rms = np.sqrt(np.mean(np.square(full_data)))
-            db_level = 20 * np.log10(rms) if rms > 0 else -float('inf')
-            logging.info(f"Average sound level: {db_level:.2f} dB")
-
-            # Write the dB level to a file
-
-            db_file = os.path.join(os.getcwd(), "Average_dB.txt")
-            with open(db_file, 'w') as f:
-                f.write(f"Average Sound Level: {db_level:.2f} dB\n")
-            logging.info(f"Average sound level saved to: {db_file}")
+        clock_origin = time.perf_counter()
+
+        # Audio is written to disk chunk by chunk while its loudness is tracked per second
+        sample_rate = 44100
+        audio_file = os.path.join(OUTPUT_FOLDER, f"Recording_{current_time_str}_audio.wav")
+        meter = LoudnessMeter(sample_rate)
+        audio = AudioRecorder(audio_file, self.recording_duration, clock_origin, sample_rate=sample_rate, meter=meter,
+                              source=self.audio_source, segment_time=self.segment_time, microphone=self.microphone,
+                              metrics=self.metrics)
 
         # Start audio recording in a separate thread
-        audio_thread = threading.Thread(target=record_audio,
-                                        args=(os.path.join(OUTPUT_FOLDER, "audio.mp3"), self.recording_duration))
+        audio_thread = threading.Thread(target=audio.record, args=(sync_event, stop_recording))
         logging.info(f"Starting audio recording for {self.recording_duration} seconds.")
         audio_thread.start()
 
         # Wait for audio to be ready to start
         sync_event.wait()
 
-        # Add a small delay before starting video recording for sync
-        time.sleep(audio_delay)
-
-        # Start recording the screen
+        # Start recording the screen through the capture -> convert -> encode pipeline
         start_time = time.perf_counter()  # High precision timer for accurate time tracking
-        frame_count = 0
-        target_fps = 30  # Target frame rate for video recording
-        logging.info("Screen recording started.")
+        detector = ChangeDetector() if self.detect_duplicates else None
+        controller = None
+        if self.adaptive:
+            controller = AdaptiveController(target_fps, min_fps=min(self.min_fps, target_fps),
+                                            scaling=(width, height) != (screen["width"], screen["height"]))
+        pipeline = Pipeline(screen, target_fps, ring, encoder, queue_size=self.queue_size,
+                            policy=self.overload_policy, detector=detector, screen_source=self.screen_source,
+                            metrics=self.metrics, controller=controller)
 
         try:
-            while time.perf_counter() - start_time < self.recording_duration:
-                if stop_recording.is_set():
-                    logging.warning("Screen recording stopped early due to stop signal.")
-                    break
-
-                frame_start = time.perf_counter()  # Timer for frame capture
-
-                target_frame_time = frame_count * (1.0 / target_fps)
-                current_time = time.perf_counter() - start_time
-
-                if current_time >= target_frame_time:
-                    # Capture a frame from the screen
-                    img = sct.grab(screen)
-                    frame = np.array(img)
-                    frame = cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR)  # Convert to BGR format
-                    frames.append(frame)  # Add frame to the frames list
-                    frame_count += 1
-                    logging.debug(f"Captured frame {frame_count}")
-
-                # Ensure the frame rate stays close to the target FPS
-                elapsed = time.perf_counter() - frame_start
-                if elapsed < 1.0 / target_fps:
-                    time.sleep(1.0 / target_fps - elapsed)
-
+            pipeline.run(self.recording_duration, stop_recording, clock_origin)
         except KeyboardInterrupt:
             logging.error("Screen recording interrupted by user.")
             stop_recording.set()
+        except Exception as e:
+            # Any grab or convert failure (mss ScreenShotError, OSError, ...) ends the capture but still
+            # stops the audio and finalizes whatever was recorded
+            logging.error(f"Screen recording stopped: {str(e)}")
+            stop_recording.set()
+
+        self.first_frame_time = pipeline.first_frame_time
 
         # Wait for the audio recording thread to finish
         audio_thread.join()
         logging.info("Audio recording thread joined.")
-
-        # Calculate the actual frames per second during the recording
-        elapsed_time = time.perf_counter() - start_time
-        actual_fps = len(frames) / elapsed_time
-        logging.info(f"Actual FPS during recording: {actual_fps:.2f}")
-
-        # Save captured frames to disk
-        frames_dir = os.path.join(OUTPUT_FOLDER, "frames")
-        if not os.path.exists(frames_dir):
-            os.makedirs(frames_dir)
-            logging.info(f"Created frames directory at {frames_dir}")
-
-        # Use ThreadPoolExecutor to save frames concurrently
-        with ThreadPoolExecutor(max_workers=4) as executor:
-            futures = [executor.submit(save_frame, i, frame, frames_dir)
-                       for i, frame in enumerate(frames)]
-            for future in futures:
-                future.result()  # Wait for each frame to be saved
+        report = {"started": current_time_str, "capture_region": screen, "frame_size": [width, height]}
+        self.save_loudness(meter, current_time_str, OUTPUT_FOLDER, report)
 
         # Combine video and audio into a final output file
+        muxed = False
         try:
-            current_time_str = time.strftime("%Y-%m-%d_%H-%M-%S", time.localtime())
+            # Wait for the encoder to flush the frames still queued
+            with self.metrics.phase('encoder_flush'):
+                encoder.close()
+
+            # Calculate the actual capture and encode rates during the recording
+            elapsed_time = pipeline.end_time - pipeline.start_time
+            logging.info(f"Actual FPS during recording: {pipeline.captured / elapsed_time:.2f} captured, "
+                         f"{encoder.frame_count / elapsed_time:.2f} encoded")
+            report.update(pipeline.summary())
+            report["duration"] = elapsed_time
+            report["audio_underruns"] = audio.underruns
+            report["audio_padded"] = audio.padded
+            if controller:
+                report["adaptive"] = controller.changes
+            for name, value in pipeline.summary().items():
+                self.metrics.set(name, value)
+            logging.info("Session summary: " + ", ".join(f"{k}={v}" for k, v in pipeline.summary().items()))
+
+            # Place the audio against the first video frame using the shared clock
+            video_start = encoder.first_timestamp
+            final_fps = controller.current.fps if controller else target_fps
+            video_duration = encoder.last_timestamp / 1000 + 1.0 / final_fps
+            audio_ok = audio.error is None and audio.start_time is not None
+            if audio_ok:
+                audio_offset = audio.start_time - video_start
+                report["av_sync"] = {
+                    "video_start": video_start,
+                    "audio_start": audio.start_time,
+                    "audio_offset": audio_offset,
+                    "audio_drift": audio.drift,
+                }
+                logging.info(f"A/V skew: audio starts {audio_offset * 1000:+.1f} ms from the first frame, "
+                             f"drifted {audio.drift * 1000:+.1f} ms over the session")
+            else:
+                # Keep the captured video rather than losing it with the audio
+                audio_offset = 0.0
+                report["audio_error"] = audio.error or "no audio samples were recorded"
+                logging.error(f"Audio recording failed ({report['audio_error']}), saving the video without audio")
+
+            # Mark the ads shown while recording as chapters
+            chapters = self.ad_chapters(clock_origin + video_start, video_duration)
+            report["ads"] = [{"start": start, "end": end} for start, end, title in chapters
+                             if title == "Advertisement"]
+            if report["ads"]:
+                logging.info(f"Marked {len(report['ads'])} advertisement(s) in the recording")
+
             output_video_file = os.path.join(OUTPUT_FOLDER, f"Recording_{current_time_str}.mp4")
-            logging.info("Assembling video with MoviePy...")
-
-            # Create video clip from frames and sync with audio
-            video_clip = ImageSequenceClip(frames_dir, fps=actual_fps)
-            audio_clip = AudioFileClip(os.path.join(OUTPUT_FOLDER, "audio.mp3"))
-            sync_offset = 4  # Delay the audio to sync with video
-            audio_clip = audio_clip.set_start(sync_offset)
-            final_duration = min(video_clip.duration, audio_clip.duration - sync_offset)
-            video_clip = video_clip.set_duration(final_duration)
-            final_clip = video_clip.set_audio(audio_clip)
-
-            # Write the final video to file
-            final_clip.write_videofile(
-                output_video_file,
-                codec='libx264',
-                audio_codec='aac',
-                temp_audiofile=os.path.join(OUTPUT_FOLDER, "temp-audio.m4a"),
-                remove_temp=True,
-                threads=4,
-                preset='ultrafast'
-            )
-
-            video_clip.close()
-            audio_clip.close()
-            final_clip.close()
-            os.remove(os.path.join(OUTPUT_FOLDER, "audio.mp3"))
+            logging.info("Muxing video with audio..." if audio_ok else "Muxing video...")
+            # Segments are joined by the concat demuxer in the same pass, without re-encoding the video;
+            # audio segments already encoded while recording are copied too, so this is a pure stream copy
+            if audio.segments_encoded:
+                audio_input, audio_codec = audio.encoded_playlist, 'copy'
+            else:
+                audio_input, audio_codec = audio.playlist or audio_file, 'aac'
+            with self.metrics.phase('mux'):
+                encoder.mux(audio_input if audio_ok else None, output_video_file, audio_offset=audio_offset,
+                            duration=video_duration, chapters=chapters, audio_codec=audio_codec)
+
+            audio.remove_output()  # Also drops the empty file left by a failed audio recording
+            muxed = True
             logging.info(f"Recording saved as {output_video_file}")
 
         except Exception as e:
             logging.error(f"An error occurred while combining video and audio: {str(e)}")
 
         finally:
-            # Clean up: remove frames directory and temporary files
-            if os.path.exists(frames_dir):
-                for file in os.listdir(frames_dir):
-                    try:
-                        os.remove(os.path.join(frames_dir, file))
-                    except Exception as e:
-                        logging.warning(f"Error removing frame file: {str(e)}")
+            # Clean up: remove the intermediate video once muxed; if muxing failed it is kept so it can be recovered
+            if muxed:
                 try:
-                    os.rmdir(frames_dir)
+                    encoder.remove_output()
                 except Exception as e:
-                    logging.warning(f"Error removing frames directory: {str(e)}")
+                    logging.warning(f"Error removing intermediate video file: {str(e)}")
+            elif encoder.playlist:
+                audio_list = audio.encoded_playlist if audio.segments_encoded else audio.playlist
+                logging.warning(f"Keeping the recorded segments listed in {encoder.playlist} and {audio_list}")
+            else:
+                logging.warning(f"Keeping the recorded video {video_file} and audio {audio_file}")
+
+            # Save the session report next to the recording
+            report_file = os.path.join(OUTPUT_FOLDER, f"Recording_{current_time_str}.json")
+            with open(report_file, 'w') as f:
+                json.dump(report, f, indent=2)
+            logging.info(f"Session report saved to {report_file}")
 
-            frames.clear()  # Clear frames list to free memory
             logging.info(f"Total process time: {time.perf_counter() - start_time}")
@@ -0,0 +1,141 @@
+import argparse
+import logging
+import multiprocessing
+import os
+import select
+import shutil
+import subprocess
+
+
+def start_display(display, width, height, timeout=10):
+    # Start a private Xvfb server and wait until it reports that it accepts clients; -displayfd makes Xvfb
+    # write the display number only once it is ready, and close the pipe if it can't take the display
+    # (in use, or a lock it can't clear), so a socket left behind by another server is never mistaken for ours
+    read_fd, write_fd = os.pipe()
+    try:
+        xvfb = subprocess.Popen(["Xvfb", f":{display}", "-screen", "0", f"{width}x{height}x24", "-nolisten", "tcp",
+                                 "-displayfd", str(write_fd)],
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, pass_fds=(write_fd,))
+    finally:
+        os.close(write_fd)
+    try:
+        ready, _, _ = select.select([read_fd], [], [], timeout)
+        if not ready:
+            xvfb.terminate()
+            raise RuntimeError(f"Xvfb :{display} did not start within {timeout} seconds")
+        reported = os.read(read_fd, 16).decode().strip()
+    finally:
+        os.close(read_fd)
+    if reported != str(display) or xvfb.poll() is not None:
+        if xvfb.poll() is None:
+            xvfb.terminate()
+        try:
+            code = xvfb.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            xvfb.kill()
+            code = xvfb.wait()
+        raise RuntimeError(f"Xvfb :{display} exited with code {code} (display in use or left locked?)")
+    return xvfb
+
+
+def load_sink(name):
+    # Create a PulseAudio null sink for this session; returns the module index, or None if unavailable
+    if not shutil.which("pactl"):
+        logging.warning("pactl not found, the session will record the default speaker")
+        return None
+    result = subprocess.run(["pactl", "load-module", "module-null-sink", f"sink_name={name}",
+                             f"sink_properties=device.description={name}"],
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        logging.warning(f"Could not create audio sink {name}: {result.stderr.strip()}")
+        return None
+    return result.stdout.strip()
+
+
+def unload_sink(module):
+    # Remove the null sink created for the session
+    if module is not None:
+        subprocess.run(["pactl", "unload-module", module], capture_output=True)
+
+
+def run_session(index, display, output_folder, duration, jobs, width, height):
+    # Child process: one Xvfb display, one audio sink, one output folder, one browser profile
+    name = f"session_{index}"
+    os.makedirs(output_folder, exist_ok=True)
+    xvfb = start_display(display, width, height)
+    module = load_sink(name)
+    try:
+        # Everything started from here on (mss, Firefox, PulseAudio clients) uses the private display and sink
+        os.environ["DISPLAY"] = f":{display}"
+        if module is not None:
+            os.environ["PULSE_SINK"] = name
+        from Main import Main  # Imported after the environment is set up
+
+        # Record the sink's monitor by its exact source id: soundcard falls back to matching names by substring,
+        # so "session_1" alone would also pick up "Monitor of session_10"
+        main = Main(recording_duration=duration, output_folder=output_folder,
+                    audio_source=f"{name}.monitor" if module is not None else None, session_name=name)
+        logging.info(f"Session {index} running on display :{display}, writing to {output_folder}")
+        if jobs > 1:
+            main.run_batch(jobs)
+        else:
+            main.run()
+    finally:
+        unload_sink(module)
+        xvfb.terminate()
+        try:
+            xvfb.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            xvfb.kill()
+
+
+class Scheduler:
+    def __init__(self, sessions, recording_duration, jobs_per_session=1, base_display=100,
+                 output_root="sessions", width=1920, height=1080):
+        # Run independent recording sessions in parallel, each in its own process and virtual display
+        self.sessions = sessions
+        self.recording_duration = recording_duration
+        self.jobs_per_session = jobs_per_session  # Videos recorded one after another in each session
+        self.base_display = base_display  # Session i uses display :base_display+i
+        self.output_root = output_root  # Session i writes to output_root/session_i
+        self.width = width
+        self.height = height
+
+    def run(self):
+        # Start every session, wait for all of them and return their exit codes
+        context = multiprocessing.get_context("spawn")  # Fresh interpreters, nothing inherited from the parent
+        processes = []
+        for index in range(self.sessions):
+            output_folder = os.path.join(self.output_root, f"session_{index}")
+            process = context.Process(target=run_session, name=f"session_{index}",
+                                      args=(index, self.base_display + index, output_folder,
+                                            self.recording_duration, self.jobs_per_session,
+                                            self.width, self.height))
+            process.start()
+            processes.append(process)
+            logging.info(f"Started session {index} (pid {process.pid})")
+
+        exit_codes = []
+        for index, process in enumerate(processes):
+            process.join()
+            exit_codes.append(process.exitcode)
+            if process.exitcode:
+                logging.error(f"Session {index} failed with exit code {process.exitcode}")
+            else:
+                logging.info(f"Session {index} finished")
+        return exit_codes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record several sessions in parallel on virtual displays")
+    parser.add_argument("--sessions", type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help="number of parallel sessions")
+    parser.add_argument("--duration", type=float, default=70, help="recording duration in seconds")
+    parser.add_argument("--jobs", type=int, default=1, help="videos recorded by each session")
+    parser.add_argument("--output", default="sessions", help="folder holding one subfolder per session")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    scheduler = Scheduler(args.sessions, args.duration, jobs_per_session=args.jobs, output_root=args.output)
+    codes = scheduler.run()
+    raise SystemExit(1 if any(codes) else 0)
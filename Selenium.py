@@ -6,170 +6,327 @@ from selenium.common.exceptions import TimeoutException
 import logging
 import time
 import random
-import socket
+from urllib.parse import quote, quote_plus
+import numpy as np
+from AdWatcher import AdWatcher
+from Metrics import NULL_METRICS
+from Preflight import check_connection
 
 class Selenium:
-    def __init__(self, recording_duration):
+    SEARCH_QUERY = "official music video"
+    SEARCH_FILTER = "EgIYAQ%3D%3D"  # YouTube's 'sp' search filter parameter
+
+    def __init__(self, recording_duration, driver=None, cache=None, base_url="https://www.youtube.com",
+                 metrics=NULL_METRICS):
         self.recording_duration = recording_duration
+        self.base_url = base_url  # Site to search; benchmarks point this at a local fixture server
         self.min_video_duration = 120
         self.long_videos = []
+        self.enough_videos = 10  # Stop scrolling once this many long videos are on the page
+        self.run_start = None  # When the current run started, for per-step timings
+        self.step_start = None
+        self.ad_watcher = None  # In-page ad observer for the current video
+        self.on_ad = None  # Callback for ad events
+        self.cache = cache  # Optional CandidateCache that lets runs skip the search page
+        self.from_cache = False  # Whether long_videos came from the cache rather than the live page
 
-        # Initialize WebDriver for Firefox and WebDriverWait for waiting conditions
-        self.driver = webdriver.Firefox()
+        # Initialize WebDriver for Firefox (unless a warm one is handed over) and WebDriverWait for waiting conditions
+        self.owns_driver = driver is None  # Browsers lent by a BrowserPool are reset by the pool, not quit
+        self.driver = driver or webdriver.Firefox()
+        self.metrics = metrics  # Step timings and the count and latency of every WebDriver command
+        self.metrics.instrument_driver(self.driver)
         self.wait = WebDriverWait(self.driver, 5)
         logging.info("WebDriver initialized successfully")
 
-    def check_internet_connection(self, host="8.8.8.8", port=53, timeout=3):
+    def check_internet_connection(self, host="8.8.8.8", port=53, timeout=3, attempts=1):
         # Check if the system has an active internet connection.
-        try:
-            socket.setdefaulttimeout(timeout)
-            socket.socket(socket.AF_INET, socket.SOCK_STREAM).connect((host, port))
-            return True
-        except Exception as e:
-            logging.error(f"Internet connection check failed: {str(e)}")
-            return False
+        return check_connection(host, port, timeout, attempts=attempts)
+
+    def log_step(self, step):
+        # Log how long a step took and how far into the run it finished
+        now = time.perf_counter()
+        self.metrics.record_phase(f"step: {step}", now - self.step_start)
+        logging.info(f"Step '{step}' took {now - self.step_start:.2f} s "
+                     f"({now - self.run_start:.2f} s since start)")
+        self.step_start = now
 
-    def handle_cookie(self):
+    def wait_for_document_ready(self, timeout=10):
+        # Wait until the page has finished loading
+        WebDriverWait(self.driver, timeout).until(
+            lambda driver: driver.execute_script("return document.readyState") == "complete"
+        )
+
+    def handle_cookie(self, content_locator=(By.TAG_NAME, "ytd-video-renderer")):
         # Handle cookie consent popup
+        cookie_locator = (By.XPATH, "//button[contains(@aria-label, 'Accept')]")
         try:
             logging.info("Looking for cookie consent popup")
-            # Wait for the cookie consent button to be clickable and accept it
-            cookie_button = self.wait.until(
-                EC.element_to_be_clickable((By.XPATH, "//button[contains(@aria-label, 'Accept')]"))
-            )
-            cookie_button.click()
+            # Wait for either the consent button or the page content, whichever shows up first
+            self.wait.until(EC.any_of(
+                EC.element_to_be_clickable(cookie_locator),
+                EC.presence_of_element_located(content_locator)
+            ))
+            cookie_buttons = self.driver.find_elements(*cookie_locator)
+            if not cookie_buttons:
+                logging.info("No cookie consent popup found")
+                return
+            cookie_buttons[0].click()
+            # Wait for the dialog to go away instead of sleeping
+            self.wait.until(EC.invisibility_of_element_located(cookie_locator))
             logging.info("Cookie consent accepted")
-            time.sleep(2)
         except TimeoutException:
             # If no cookie popup appears, log the absence of it
             logging.info("No cookie consent popup found")
 
-    def scroll_page(self, scroll_count=3):
-        # Scroll the page to load more content.
+    def result_count(self):
+        # Number of search results currently in the page
+        return self.driver.execute_script("return document.querySelectorAll('ytd-video-renderer').length")
+
+    def scroll_page(self, scroll_count=3, timeout=3):
+        # Scroll the page to load more content, stopping once enough long videos are available
         for _ in range(scroll_count):
+            self.find_video(required=False)
+            if len(self.long_videos) >= self.enough_videos:
+                logging.info(f"Found {len(self.long_videos)} long videos, no need to scroll further")
+                return
+            count = self.result_count()
             self.driver.execute_script("window.scrollBy(0, 1000)")
-            time.sleep(1)
-
-    def find_video(self):
-        #Find videos on the page, filter them by duration, and add long ones to the list.
-        logging.info("Searching for videos")
-        # Locate video elements based on the specified XPath
-        videos = self.driver.find_elements(
-            By.XPATH,
-            "//ytd-video-renderer[.//span[@class='style-scope ytd-thumbnail-overlay-time-status-renderer']]"
-        )
-        logging.info(f"Found {len(videos)} total videos")
-
-        for index, video in enumerate(videos, 1):
             try:
-                # Get the duration of each video and parse it into seconds
-                duration_element = video.find_element(
-                    By.XPATH,
-                    ".//span[@class='style-scope ytd-thumbnail-overlay-time-status-renderer']"
-                )
-                duration = duration_element.get_attribute("textContent").strip()
-                title = video.find_element(By.ID, "video-title").get_attribute("title")
-
-                # Parse duration (e.g., "3:15" or "1:05:30")
-                time_parts = duration.split(':')
-                total_seconds = 0
-                if len(time_parts) == 2:
-                    minutes, seconds = map(int, time_parts)
-                    total_seconds = minutes * 60 + seconds
-                elif len(time_parts) == 3:
-                    hours, minutes, seconds = map(int, time_parts)
-                    total_seconds = hours * 3600 + minutes * 60 + seconds
-
-                logging.info(f"Video {index}: '{title}' - Duration: {duration}")
-
-                if total_seconds > self.min_video_duration:
-                    # If the video is longer than the minimum duration, add it to the list
-                    video_link = video.find_element(By.ID, "video-title")
-                    self.long_videos.append((video_link, duration, title))
-                    logging.info(f"Added to long videos list")
-                else:
-                    logging.info("Video too short, skipping")
-
-            except Exception as e:
-                # Log any errors encountered during the process
-                logging.warning(f"Error processing video {index}: {str(e)}")
-                continue
+                # Wait for the next batch of results to be appended
+                WebDriverWait(self.driver, timeout).until(lambda driver: self.result_count() > count)
+            except TimeoutException:
+                logging.info("No more results loaded after scrolling")
+                return
+
+    # Collect every search result in a single round trip: link, title and duration in seconds
+    EXTRACT_VIDEOS_SCRIPT = """
+        const toSeconds = text => {
+            const parts = text.trim().split(':');
+            if (parts.length < 2 || parts.length > 3 || parts.some(p => !/^\\d+$/.test(p))) return null;
+            return parts.reduce((total, part) => total * 60 + Number(part), 0);
+        };
+        const videos = [];
+        for (const video of document.querySelectorAll('ytd-video-renderer')) {
+            const duration = video.querySelector('span.ytd-thumbnail-overlay-time-status-renderer');
+            const link = video.querySelector('#video-title');
+            if (!duration || !link) continue;
+            videos.push({
+                href: link.href || link.getAttribute('href'),
+                title: link.getAttribute('title') || link.textContent.trim(),
+                duration: duration.textContent.trim(),
+                duration_seconds: toSeconds(duration.textContent)
+            });
+        }
+        return videos;
+    """
+
+    def find_video(self, required=True):
+        # Find videos on the page, filter them by duration, and add long ones to the list.
+        # While scrolling (required=False) it only refreshes the list and stays quiet.
+        videos = self.driver.execute_script(self.EXTRACT_VIDEOS_SCRIPT) or []
+
+        # Filter all durations at once; unparsable ones (live streams, premieres) count as 0
+        durations = np.array([video["duration_seconds"] or 0 for video in videos], dtype=np.int64)
+        long_enough = durations > self.min_video_duration
+        self.long_videos = [video for video, keep in zip(videos, long_enough) if keep and video["href"]]
+        if not required:
+            return
+
+        logging.info(f"Found {len(videos)} total videos")
+        for index, (video, keep) in enumerate(zip(videos, long_enough), 1):
+            logging.info(f"Video {index}: '{video['title']}' - Duration: {video['duration']}"
+                         f"{'' if keep else ' (too short, skipping)'}")
+        logging.info(f"Added {len(self.long_videos)} videos to long videos list")
 
         if not self.long_videos:
             # If no videos are long enough, raise an error
             logging.error("No suitable videos found")
             raise ValueError("No suitable videos found")
 
+    def search_url(self):
+        return (f"{self.base_url}/results?search_query={quote_plus(self.SEARCH_QUERY)}"
+                f"&sp={quote(self.SEARCH_FILTER)}")
+
+    def search(self):
+        # Load the search page, collect the long videos and store them in the cache
+        logging.info("Navigating to YouTube music videos search")
+        # Go to YouTube search page for official music videos
+        self.driver.get(self.search_url())
+        self.wait_for_document_ready()
+        self.log_step("load search page")
+        self.handle_cookie()
+        self.log_step("cookie consent")
+        self.scroll_page()
+        self.find_video()
+        self.from_cache = False
+        if self.cache:
+            self.cache.put(self.SEARCH_QUERY, self.SEARCH_FILTER, self.long_videos)
+        self.log_step("collect videos")
+
+    def collect_candidates(self):
+        # Use cached candidates when there are any, refreshing them in the background once stale;
+        # fall back to the live search page otherwise
+        if self.cache:
+            videos, stale = self.cache.get(self.SEARCH_QUERY, self.SEARCH_FILTER)
+            if videos:
+                self.long_videos = videos
+                self.from_cache = True
+                logging.info(f"Using {len(videos)} cached candidates{' (stale, refreshing)' if stale else ''}")
+                if stale:
+                    self.cache.refresh_async(self.SEARCH_QUERY, self.SEARCH_FILTER, self.search_url(),
+                                             self.min_video_duration)
+                self.log_step("cached candidates")
+                return
+        self.search()
+
+    def open_video(self, attempts=3):
+        # Open a candidate, dropping unavailable ones from the cache and trying another
+        for _ in range(attempts):
+            video = self.select_video()
+            try:
+                if self.from_cache:
+                    # The search page was skipped, so the consent popup may show up here instead
+                    self.handle_cookie(content_locator=(By.TAG_NAME, "video"))
+                # Wait for the player's video element instead of a fixed delay
+                WebDriverWait(self.driver, 15).until(EC.presence_of_element_located((By.TAG_NAME, "video")))
+                available = not self.driver.find_elements(By.CSS_SELECTOR, ".ytp-error")
+            except TimeoutException:
+                available = False
+            if available:
+                if self.cache:
+                    self.cache.touch(video["href"])
+                return
+            logging.warning(f"Video '{video['title']}' is unavailable")
+            if self.cache:
+                self.cache.invalidate(video["href"])
+            self.long_videos.remove(video)
+            if not self.long_videos:
+                self.search()
+        raise ValueError("No playable video found")
+
     def select_video(self):
         # Select a random long video from the list and navigate to it.
-        random_video, duration, title = random.choice(self.long_videos)
-        logging.info(f"Selected video: '{title}' - Duration: {duration}")
+        video = random.choice(self.long_videos)
+        logging.info(f"Selected video: '{video['title']}' - Duration: {video['duration']}")
 
-        video_url = random_video.get_attribute('href')
+        video_url = video["href"]
         if not video_url:
             logging.error("Failed to get video URL")
             raise ValueError("Failed to get video URL")
 
         if not video_url.startswith('http'):
-            video_url = f"https://www.youtube.com{video_url}"
+            video_url = f"{self.base_url}{video_url}"
 
         logging.info(f"Navigating to video: {video_url}")
         self.driver.get(video_url)
-        time.sleep(5)
+        return video
+
+    def video_playing(self, driver=None):
+        # True once the <video> element has enough data to play and is actually playing
+        return (driver or self.driver).execute_script("""
+            const video = document.querySelector('video');
+            return !!video && video.readyState >= 3 && !video.paused;
+        """)
 
-    def start_playback(self):
+    def start_playback(self, timeout=10):
         # Click video player thumbnail to start playback
+        logging.info("Attempting to start video playback")
+        thumbnails = self.driver.find_elements(By.CLASS_NAME, "ytp-cued-thumbnail-overlay")
+        if thumbnails and thumbnails[0].is_displayed():
+            # The video is cued rather than autoplaying: click the thumbnail to start it
+            thumbnails[0].click()
         try:
-            logging.info("Attempting to start video playback")
-            # Try to click the video player thumbnail to start playback
-            player = self.driver.find_element(By.CLASS_NAME, "ytp-cued-thumbnail-overlay")
-            player.click()
+            WebDriverWait(self.driver, timeout).until(self.video_playing)
             logging.info("Video playback started")
-        except Exception:
-            # If the video starts automatically, log it
-            logging.info("Video may have started automatically")
+        except TimeoutException:
+            logging.warning("Video did not start playing in time")
 
-    def handle_ads(self):
-        # Handle ads by skipping them when possible
-        while True:
-            try:
-                # Detect if an ad is playing by looking for the ad overlay element
-                ad = self.driver.find_element(By.XPATH, "//div[contains(@class, 'ytp-ad-player-overlay')]")
-                if ad:
-                    logging.info("Advertisement detected")
-                    try:
-                        # Wait for the skip button to be present and click it
-                        skip_button = WebDriverWait(self.driver, 2).until(
-                            EC.presence_of_element_located((By.XPATH,
-                                                            "/html/body/ytd-app/div[1]/ytd-page-manager/ytd-watch-flexy/div[5]/div[1]/div/div[1]/div[2]/div/div/ytd-player/div/div/div[6]/div/div[3]/div/button/div")))
-                        time.sleep(5)
-                        skip_button.click()
-                        logging.info("Advertisement skipped")
-                    except Exception:
-                        # If the ad is unskippable, wait before continuing
-                        logging.info("Unskippable advertisement, waiting")
-                        time.sleep(6)
-            except Exception:
-                logging.info("No advertisements detected")
-                break
-
-    def run(self):
+    def get_player_rect(self):
+        # Report the bounding rectangle of the video player in screen pixels
+        try:
+            rect = self.driver.execute_script("""
+                const player = document.querySelector('#movie_player') || document.querySelector('video');
+                if (!player) return null;
+                const r = player.getBoundingClientRect();
+                const scale = window.devicePixelRatio || 1;
+                // Offset of the page viewport inside the browser window (borders, tabs and toolbars)
+                const border = (window.outerWidth - window.innerWidth) / 2;
+                const chrome = window.outerHeight - window.innerHeight - border;
+                return {
+                    left: Math.round((window.screenX + border + r.left) * scale),
+                    top: Math.round((window.screenY + chrome + r.top) * scale),
+                    width: Math.round(r.width * scale),
+                    height: Math.round(r.height * scale)
+                };
+            """)
+        except Exception as e:
+            logging.warning(f"Error locating the video player: {str(e)}")
+            rect = None
+        if not rect or rect["width"] <= 0 or rect["height"] <= 0:
+            logging.warning("Could not locate the video player on screen")
+            return None
+        logging.info(f"Video player located at {rect}")
+        return rect
+
+    def handle_ads(self, timeout=120):
+        # Skip pre-roll ads as soon as skipping is possible, driven by the in-page ad watcher
+        self.ad_watcher = AdWatcher(self.driver, on_event=self.on_ad)
+        try:
+            if not self.ad_watcher.install():
+                logging.warning("Video player not found, cannot watch for advertisements")
+                self.ad_watcher = None
+                return
+            self.ad_watcher.wait(0)  # Pick up an ad that was already showing when the watcher was installed
+            self.ad_watcher.watch(timeout, until_no_ad=True)
+            logging.info("No advertisements detected")
+        except Exception as e:
+            # A WebDriver hiccup (script timeout, navigation, stale player) must not keep the recording from starting
+            logging.error(f"Error handling advertisements: {str(e)}")
+            self.ad_watcher = None
+
+    def keep_playing(self, finished=None):
+        # Let the video play, skipping mid-roll ads, until the finished event is set (the recording is done)
+        # or, without one, for the recording duration
+        end = time.perf_counter() + self.recording_duration
+        while (not finished.is_set()) if finished else time.perf_counter() < end:
+            step = 1.0 if finished else end - time.perf_counter()
+            if self.ad_watcher:
+                try:
+                    self.ad_watcher.watch(step)
+                    continue
+                except Exception as e:
+                    logging.error(f"Error watching for advertisements, letting the video play: {str(e)}")
+                    self.ad_watcher = None
+            if finished:
+                finished.wait(step)
+            else:
+                time.sleep(max(0.0, step))
+
+    def run(self, on_playback=None, on_ad=None, recording_finished=None):
+        # Find and play a video; on_playback is called with the player rectangle once playback is running
+        # and on_ad(kind, timestamp) with every ad event ('ad_start', 'skip_available', 'ad_end'); once
+        # recording started the browser is kept open until recording_finished is set
+        self.on_ad = on_ad
+        self.run_start = self.step_start = time.perf_counter()
         try:
-            logging.info("Navigating to YouTube music videos search")
-            # Go to YouTube search page for official music videos
-            self.driver.get("https://www.youtube.com/results?search_query=official+music+video&sp=EgIYAQ%253D%253D")
-            self.handle_cookie()
-            self.scroll_page()
-            self.find_video()
-            self.select_video()
+            self.collect_candidates()
+            self.open_video()
+            self.log_step("open video")
             self.start_playback()
+            self.log_step("start playback")
             self.handle_ads()
+            self.log_step("ads")
+            if on_playback:
+                on_playback(self.get_player_rect())
+                self.log_step("start recording")
+                logging.info(f"Time to first frame: {time.perf_counter() - self.run_start:.2f} s")
             logging.info("Playing video...")
-            time.sleep(self.recording_duration)
+            self.keep_playing(recording_finished if on_playback else None)
         except Exception as e:
             # Log any errors encountered during the automation
             logging.error(f"Error during YouTube automation: {str(e)}")
         finally:
-            # Quit the driver after the process is complete
-            self.driver.quit()
-            logging.info("WebDriver closed")
+            # Quit the driver after the process is complete, unless it goes back to a pool
+            if self.owns_driver:
+                self.driver.quit()
+                logging.info("WebDriver closed")
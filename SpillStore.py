@@ -0,0 +1,137 @@
+import collections
+import logging
+import mmap
+import os
+import tempfile
+import threading
+import numpy as np
+from StageQueue import StageQueue
+
+
+class SpilledFrame:
+    def __init__(self, store, extent, index, timestamp):
+        # A frame held in one of the store's memory-mapped extents
+        self.store = store
+        self.extent = extent
+        self.index = index  # Record number inside the extent
+        self.timestamp = timestamp
+        self.frame = extent.frames[index]  # View straight into the mapped file, nothing is copied
+
+    def release(self):
+        # Tell the store the record has been consumed
+        self.frame = None
+        self.store.release(self)
+
+
+class Extent:
+    def __init__(self, directory, records, shape):
+        # One spill file of `records` fixed-stride frames; the file is unlinked as soon as it is mapped,
+        # so the disk space goes away with the last view of it, even if the process dies
+        stride = int(np.prod(shape))
+        fd, path = tempfile.mkstemp(prefix="spill_", suffix=".raw", dir=directory)
+        try:
+            os.ftruncate(fd, records * stride)
+            self.map = mmap.mmap(fd, records * stride)
+        finally:
+            os.close(fd)
+            os.unlink(path)
+        self.frames = np.ndarray((records, *shape), dtype=np.uint8, buffer=self.map)
+        self.records = records
+        self.written = 0  # Records filled so far
+        self.released = 0  # Records already consumed
+
+
+class SpillStore:
+    def __init__(self, width, height, directory=None, extent_frames=128):
+        # Append-only store of BGR frames in memory-mapped files, read back in order through zero-copy views
+        self.shape = (height, width, 3)
+        self.frame_bytes = width * height * 3  # Fixed stride of every record
+        self.directory = directory  # Where the spill files go (default: the system temp directory)
+        self.extent_frames = extent_frames  # Records per file
+        self.extents = collections.deque()  # Extents with records not yet released, oldest first
+        self.index = collections.deque()  # (timestamp, extent, record) of every stored frame not yet read
+        self.lock = threading.Lock()
+        self.spilled = 0  # Frames written since the store was created
+        self.peak_bytes = 0  # Largest amount of disk used at once
+
+    def append(self, frame, timestamp):
+        # Copy a frame into the next free record, opening a new extent when the current one is full
+        with self.lock:
+            if not self.extents or self.extents[-1].written == self.extents[-1].records:
+                self.extents.append(Extent(self.directory, self.extent_frames, self.shape))
+                self.peak_bytes = max(self.peak_bytes, len(self.extents) * self.extent_frames * self.frame_bytes)
+            extent = self.extents[-1]
+            index = extent.written
+            extent.written += 1
+        np.copyto(extent.frames[index], frame)
+        with self.lock:
+            self.index.append((timestamp, extent, index))
+            self.spilled += 1
+
+    def pop(self):
+        # Oldest stored frame as a SpilledFrame, or None if the store is empty
+        with self.lock:
+            if not self.index:
+                return None
+            timestamp, extent, index = self.index.popleft()
+        return SpilledFrame(self, extent, index, timestamp)
+
+    def release(self, spilled):
+        # Forget extents once every record in them was written and consumed
+        with self.lock:
+            extent = spilled.extent
+            extent.released += 1
+            while self.extents and self.extents[0].released == self.extents[0].records:
+                self.extents.popleft()
+
+    def __len__(self):
+        return len(self.index)
+
+    def close(self):
+        # Drop every extent; the mappings are freed once the last frame view is gone
+        with self.lock:
+            self.extents.clear()
+            self.index.clear()
+
+
+class SpillQueue(StageQueue):
+    def __init__(self, name, memory_frames, store):
+        # Encode queue that keeps up to memory_frames frames in RAM and spills the rest to a SpillStore
+        # instead of dropping them or blocking the capture; frames come out in capture order either way
+        super().__init__(name, memory_frames, policy='block')
+        self.store = store
+        self.in_memory = 0  # Queued frames still held in ring slots
+        self.spilled = 0  # Frames that went through the spill store
+
+    def put(self, item):
+        with self.condition:
+            if self.closed:
+                self._discard(item)
+                return False
+            if self.in_memory < self.maxsize:
+                self.in_memory += 1
+                self.items.append(item)
+                self.max_depth = max(self.max_depth, len(self.items))
+                self.condition.notify_all()
+                return True
+        # Over the memory budget: copy the frame into the spill file and give its ring slot back right away
+        if not self.spilled:
+            logging.warning(f"Encoder is falling behind, spilling frames to disk "
+                            f"({self.store.frame_bytes / 1e6:.1f} MB each)")
+        self.store.append(getattr(item, 'frame', item), getattr(item, 'timestamp', None))
+        self._discard(item)
+        with self.condition:
+            self.items.append(self.store)  # Placeholder: the frame is taken from the store in order
+            self.spilled += 1
+            self.max_depth = max(self.max_depth, len(self.items))
+            self.condition.notify_all()
+        return True
+
+    def get(self):
+        item = super().get()
+        if item is self.store:
+            return self.store.pop()
+        if item is not None:
+            with self.condition:
+                self.in_memory -= 1
+        return item
@@ -0,0 +1,66 @@
+import collections
+import threading
+
+
+class StageQueue:
+    POLICIES = ('block', 'drop_oldest', 'drop_newest')
+
+    def __init__(self, name, maxsize, policy='block'):
+        # Bounded queue between two pipeline stages with a configurable overload policy
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown overload policy '{policy}', expected one of {self.POLICIES}")
+        self.name = name
+        self.maxsize = maxsize
+        self.policy = policy
+        self.items = collections.deque()
+        self.condition = threading.Condition()
+        self.closed = False  # Set once the producer has finished
+        self.dropped = 0  # Items discarded because the queue was full
+        self.max_depth = 0  # Deepest the queue got during the session
+
+    def put(self, item):
+        # Add an item, applying the overload policy when the queue is full; returns False if it was dropped
+        discarded = None
+        with self.condition:
+            if len(self.items) >= self.maxsize:
+                if self.policy == 'drop_newest':
+                    self.dropped += 1
+                    discarded = item
+                elif self.policy == 'drop_oldest':
+                    self.dropped += 1
+                    discarded = self.items.popleft()
+                else:
+                    while len(self.items) >= self.maxsize and not self.closed:
+                        self.condition.wait()
+            if discarded is not item:
+                self.items.append(item)
+                self.max_depth = max(self.max_depth, len(self.items))
+                self.condition.notify_all()
+        if discarded is not None:
+            self._discard(discarded)
+        return discarded is not item
+
+    def get(self):
+        # Take the oldest item, waiting for one; returns None once the queue is closed and empty
+        with self.condition:
+            while not self.items and not self.closed:
+                self.condition.wait()
+            if not self.items:
+                return None
+            item = self.items.popleft()
+            self.condition.notify_all()
+            return item
+
+    def close(self):
+        # Mark the end of the stream and wake up any waiting stage
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def __len__(self):
+        return len(self.items)
+
+    def _discard(self, item):
+        # Give the resources of a dropped item back (e.g. ring slots)
+        if hasattr(item, 'release'):
+            item.release()
@@ -0,0 +1,84 @@
+# Compare the per-frame allocations and frame-interval jitter of the old capture path
+# (np.array + cv2.cvtColor per frame) with the preallocated FrameRing.
+# Allocations are the peak transient memory traced while capturing one frame; the grab
+# buffer owned by mss is counted in both runs since it cannot be avoided.
+#
+# Usage: python benchmarks/bench_capture.py [--frames 300] [--fps 30] [--real]
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+import numpy as np
+import cv2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from FrameRing import FrameRing
+from sources import FakeScreen
+
+
+def capture_copy(sct, screen):
+    # The original record loop: grab, copy into a new array, convert into another new array
+    frame = np.array(sct.grab(screen))
+    return cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR)
+
+
+def run(name, capture, frames, fps, frame_bytes):
+    # Capture frames at the target rate, measuring transient allocations and frame intervals
+    intervals = []
+    allocated = []
+    start = time.perf_counter()
+    last = None
+    for frame_count in range(frames):
+        target = start + frame_count / fps
+        delay = target - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        now = time.perf_counter()
+        if last is not None:
+            intervals.append(now - last)
+        last = now
+
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        capture()
+        _, peak = tracemalloc.get_traced_memory()
+        allocated.append(max(peak - current, 0))
+
+    intervals = np.array(intervals) * 1000
+    allocated = np.array(allocated)
+    print(f"{name}:")
+    print(f"  allocated per frame:   {allocated.mean() / 1e6:.2f} MB peak transient "
+          f"(~{allocated.mean() / frame_bytes:.1f} frame buffers)")
+    print(f"  frame interval p50:    {np.percentile(intervals, 50):.2f} ms")
+    print(f"  frame interval p99:    {np.percentile(intervals, 99):.2f} ms")
+    print(f"  frame interval max:    {intervals.max():.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--fps", type=float, default=30)
+    parser.add_argument("--real", action="store_true", help="grab the real primary monitor with mss")
+    args = parser.parse_args()
+
+    if args.real:
+        import mss
+        sct = mss.mss()
+    else:
+        sct = FakeScreen()
+    screen = sct.monitors[1]
+    frame_bytes = screen["width"] * screen["height"] * 3
+    ring = FrameRing(screen["width"], screen["height"])
+
+    def capture_ring():
+        ring.capture(sct, screen).release()
+
+    tracemalloc.start()
+    run("before (np.array + cvtColor)", lambda: capture_copy(sct, screen), args.frames, args.fps, frame_bytes)
+    run("after (FrameRing)", capture_ring, args.frames, args.fps, frame_bytes)
+    tracemalloc.stop()
+
+
+if __name__ == "__main__":
+    main()
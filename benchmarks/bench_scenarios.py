@@ -0,0 +1,175 @@
+# Offline scenario runs of Recording.record_screen and Selenium.run against synthetic sources:
+# a scrolling (or static) fake screen, a generated tone instead of the sound card, and local
+# fixture pages instead of YouTube. Each scenario runs in its own process so peak RSS is its own,
+# and the results are printed (or written) as JSON.
+#
+# Reported per scenario:
+#   fps_captured / fps_encoded       frames per second achieved by the capture and encode stages
+#   frame_interval_p50/p99_ms        spacing between consecutive grabs
+#   time_to_first_frame_s            from the start of the scenario to the first grab (recording) or to
+#                                    playback starting (selenium)
+#   finalize_s                       from the last grab until record_screen returned (encoder flush, mux)
+#   peak_rss_mb / peak_rss_children_mb
+#   stages                           p50/p99 of the recorder's own grab, convert and encode histograms
+#
+# Usage: python benchmarks/bench_scenarios.py [--scenario record_moving ...] [--duration 10] [--output out.json]
+import argparse
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sources import FakeScreen, FakeMicrophone, FixtureServer
+
+RECORD_SCENARIOS = {
+    # name: (moving screen, segment length in seconds)
+    "record_static": (False, None),
+    "record_moving": (True, None),
+    "record_segmented": (True, 5),
+}
+SCENARIOS = list(RECORD_SCENARIOS) + ["selenium"]
+
+
+def peak_rss():
+    # ru_maxrss is in kilobytes on Linux
+    return {
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "peak_rss_children_mb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+    }
+
+
+def interval_stats(times):
+    intervals = np.diff(np.array(times)) * 1000
+    if not len(intervals):
+        return {"frame_interval_p50_ms": None, "frame_interval_p99_ms": None}
+    return {
+        "frame_interval_p50_ms": float(np.percentile(intervals, 50)),
+        "frame_interval_p99_ms": float(np.percentile(intervals, 99)),
+    }
+
+
+def run_recording(name, duration, width, height, fps):
+    from Recording import Recording
+    from Metrics import Metrics
+    moving, segment_time = RECORD_SCENARIOS[name]
+    screen = FakeScreen(width, height, moving=moving)
+    metrics = Metrics()
+    with tempfile.TemporaryDirectory(prefix="bench_") as folder:
+        recording = Recording(duration, target_fps=fps, output_folder=folder,
+                              db_file=os.path.join(folder, "Average_dB.txt"), segment_time=segment_time,
+                              screen_source=screen, microphone=FakeMicrophone(), metrics=metrics)
+        start = time.perf_counter()
+        recording.record_screen()
+        end = time.perf_counter()
+        reports = [f for f in os.listdir(folder) if f.endswith(".json")]
+        with open(os.path.join(folder, reports[0])) as f:
+            report = json.load(f)
+        recorded = any(f.startswith("Recording_") and f.endswith(".mp4") for f in os.listdir(folder))
+
+    elapsed = report.get("duration") or (screen.grab_times[-1] - screen.grab_times[0])
+    result = {
+        "scenario": name,
+        "frame_size": report["frame_size"],
+        "duration_s": elapsed,
+        "fps_captured": report.get("captured", len(screen.grab_times)) / elapsed,
+        "fps_encoded": report.get("encoded", 0) / elapsed,
+        "dropped": report.get("dropped_convert", 0) + report.get("dropped_encode", 0),
+        "missed_ticks": report.get("missed_ticks", 0),
+        "time_to_first_frame_s": screen.grab_times[0] - start if screen.grab_times else None,
+        "finalize_s": end - screen.grab_times[-1] if screen.grab_times else None,
+        "output_written": recorded,
+    }
+    result.update(interval_stats(screen.grab_times))
+    result["stages"] = {name: {"p50": histogram["p50"], "p99": histogram["p99"]}
+                        for name, histogram in metrics.to_dict()["histograms"].items()}
+    return result
+
+
+def run_selenium(duration):
+    from selenium import webdriver
+    from selenium.webdriver.firefox.options import Options
+    from Selenium import Selenium
+
+    options = Options()
+    options.add_argument("-headless")
+    options.set_preference("media.autoplay.default", 0)  # Let the fixture clip start with sound
+    options.set_preference("media.autoplay.blocking_policy", 0)
+    with FixtureServer() as server:
+        start = time.perf_counter()
+        driver = webdriver.Firefox(options=options)
+        launched = time.perf_counter()
+        playback = []
+        try:
+            selenium = Selenium(duration, driver=driver, base_url=server.base_url)
+            selenium.run(on_playback=lambda rect: playback.append(time.perf_counter()))
+            end = time.perf_counter()
+        finally:
+            driver.quit()
+    return {
+        "scenario": "selenium",
+        "browser_launch_s": launched - start,
+        "time_to_first_frame_s": playback[0] - start if playback else None,
+        "run_s": end - launched,
+        "playback_started": bool(playback),
+    }
+
+
+def run_scenario(name, args):
+    logging.basicConfig(level=logging.WARNING)
+    try:
+        if name == "selenium":
+            result = run_selenium(args.duration)
+        else:
+            result = run_recording(name, args.duration, args.width, args.height, args.fps)
+    except Exception as e:
+        result = {"scenario": name, "error": f"{type(e).__name__}: {e}"}
+    result.update(peak_rss())
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS,
+                        help="scenario to run (repeatable; default: all)")
+    parser.add_argument("--duration", type=float, default=10, help="recording length of each scenario in seconds")
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--fps", type=float, default=30)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    scenarios = args.scenario or SCENARIOS
+
+    if args.child:
+        # Runs exactly one scenario and prints its result as the last line
+        print(json.dumps(run_scenario(scenarios[0], args)))
+        return
+
+    results = []
+    for name in scenarios:
+        command = [sys.executable, os.path.abspath(__file__), "--child", "--scenario", name,
+                   "--duration", str(args.duration), "--width", str(args.width), "--height", str(args.height),
+                   "--fps", str(args.fps)]
+        child = subprocess.run(command, capture_output=True, text=True)
+        lines = child.stdout.strip().splitlines()
+        try:
+            results.append(json.loads(lines[-1]))
+        except (IndexError, ValueError):
+            results.append({"scenario": name, "error": child.stderr.strip()[-2000:] or "no result"})
+        print(f"{name}: done", file=sys.stderr)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+# Stand-ins for the screen, the sound card and YouTube, so the recorder can be measured offline.
+# FakeScreen behaves like an mss.mss() instance, FakeMicrophone like a soundcard loopback microphone
+# and FixtureServer serves search and watch pages shaped like YouTube's to a real browser.
+import functools
+import http.server
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import numpy as np
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+class FakeShot:
+    def __init__(self, raw, width, height):
+        # Mimic the parts of mss.ScreenShot used by the capture path
+        self.raw = raw
+        self.width = width
+        self.height = height
+
+    def __array__(self, dtype=None, copy=None):
+        return np.frombuffer(self.raw, dtype=np.uint8).reshape(self.height, self.width, 4)
+
+
+class FakeScreen:
+    def __init__(self, width=1920, height=1080, moving=False, speed=8):
+        # Synthetic screen that allocates a fresh buffer per grab, like mss does; with moving=True
+        # the picture scrolls by `speed` rows per grab so no two consecutive frames are identical
+        primary = {"left": 0, "top": 0, "width": width, "height": height}
+        self.monitors = [dict(primary), primary]
+        self.moving = moving
+        self.speed = speed
+        self.row_bytes = width * 4
+        self.frame_bytes = width * height * 4
+        rows = height * 2 if moving else height  # Twice the height so every offset has a full frame
+        self.pattern = np.random.default_rng(0).integers(0, 255, rows * self.row_bytes, dtype=np.uint8).tobytes()
+        self.offset = 0
+        self.grab_times = []  # time.perf_counter() of every grab, for frame interval statistics
+
+    def __call__(self):
+        # Used as the screen source factory: every capture thread shares the same synthetic screen
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        pass
+
+    def grab(self, screen):
+        self.grab_times.append(time.perf_counter())
+        start = self.offset * self.row_bytes
+        if self.moving:
+            self.offset = (self.offset + self.speed) % (len(self.pattern) // self.row_bytes // 2)
+        raw = bytearray(self.pattern[start:start + self.frame_bytes])
+        return FakeShot(raw, screen["width"], screen["height"])
+
+
+class FakeRecorder:
+    def __init__(self, microphone, samplerate):
+        # Deliver generated audio in real time, like a loopback recorder blocking on the sound card
+        self.microphone = microphone
+        self.samplerate = samplerate
+        self.start = None
+        self.delivered = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def record(self, numframes):
+        first = self.delivered
+        self.delivered += numframes
+        delay = self.start + self.delivered / self.samplerate - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        return self.microphone.generate(first, numframes, self.samplerate)
+
+
+class FakeMicrophone:
+    def __init__(self, signal="tone", frequency=440.0, amplitude=0.1, channels=2):
+        # Stand-in for a soundcard loopback microphone producing a sine tone or white noise
+        self.signal = signal
+        self.frequency = frequency
+        self.amplitude = amplitude
+        self.channels = channels
+        self.rng = np.random.default_rng(0)
+
+    def recorder(self, samplerate, **kwargs):
+        return FakeRecorder(self, samplerate)
+
+    def generate(self, first, numframes, samplerate):
+        if self.signal == "noise":
+            mono = self.rng.uniform(-self.amplitude, self.amplitude, numframes)
+        else:
+            t = np.arange(first, first + numframes) / samplerate
+            mono = self.amplitude * np.sin(2 * np.pi * self.frequency * t)
+        return np.repeat(mono[:, None], self.channels, axis=1).astype(np.float32)
+
+
+class FixtureHandler(http.server.SimpleHTTPRequestHandler):
+    # /results serves the saved search page, /watch the fixture player page, anything else static files
+    ROUTES = {"/results": "search_results.html", "/watch": "watch.html"}
+
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+        if path in self.ROUTES:
+            self.path = "/" + self.ROUTES[path]
+        super().do_GET()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FixtureServer:
+    def __init__(self, port=0):
+        # Local http.server with the fixture pages and a generated clip for the watch page's <video>
+        self.port = port
+        self.root = None
+        self.server = None
+        self.thread = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def make_clip(self, path):
+        # A short WebM test pattern with a tone; the watch page loops it
+        from moviepy.config import get_setting
+        subprocess.run([
+            get_setting("FFMPEG_BINARY"), "-y", "-loglevel", "error",
+            "-f", "lavfi", "-i", "testsrc=size=640x360:rate=30",
+            "-f", "lavfi", "-i", "sine=frequency=440:sample_rate=44100",
+            "-t", "10", "-c:v", "libvpx", "-b:v", "500k", "-c:a", "libvorbis", path
+        ], check=True)
+
+    def start(self):
+        self.root = tempfile.mkdtemp(prefix="fixtures_")
+        for name in os.listdir(FIXTURES):
+            shutil.copy(os.path.join(FIXTURES, name), self.root)
+        self.make_clip(os.path.join(self.root, "clip.webm"))
+        handler = functools.partial(FixtureHandler, directory=self.root)
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", self.port), handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
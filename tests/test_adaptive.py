@@ -0,0 +1,72 @@
+# Checks that AdaptiveController turns only the knob that relieves the busiest stage: the frame rate
+# when encoding is the bottleneck, the downscale filter when converting is.
+import os
+import sys
+import types
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+cv2 = pytest.importorskip("cv2")
+from Adaptive import AdaptiveController
+
+
+class FakeQueue(list):
+    maxsize = 10
+    dropped = 0
+
+
+class FakePipeline:
+    # Counters of a pipeline whose frames cost a fixed number of seconds in each stage
+    def __init__(self, costs):
+        self.costs = costs
+        self.captured = self.converted = 0
+        self.grab_time = self.convert_time = 0.0
+        self.missed = 0
+        self.convert_queue = FakeQueue()
+        self.encoder = types.SimpleNamespace(frame_count=0, busy_time=0.0, frames=FakeQueue())
+
+    def run(self, frames):
+        self.captured += frames
+        self.converted += frames
+        self.encoder.frame_count += frames
+        self.grab_time += frames * self.costs["grab"]
+        self.convert_time += frames * self.costs["convert"]
+        self.encoder.busy_time += frames * self.costs["encode"]
+
+
+def run(controller, pipeline, windows, start=0):
+    # Evaluate the given number of one second windows, returning every level the controller switched to
+    levels = []
+    if start == 0:
+        controller.update(pipeline, 0.0)
+    for second in range(start + 1, start + windows + 1):
+        pipeline.run(int(controller.current.fps))
+        level = controller.update(pipeline, float(second))
+        if level:
+            levels.append(level)
+    return levels
+
+
+def test_encode_bound_lowers_the_frame_rate_only():
+    controller = AdaptiveController(30, min_fps=10)
+    levels = run(controller, FakePipeline({"grab": 0.002, "convert": 0.005, "encode": 0.04}), 20)
+    assert levels
+    assert all(level.interpolation == cv2.INTER_AREA for level in levels)  # The filter was never the problem
+    assert controller.current.fps < 0.9 / 0.04
+
+
+def test_convert_bound_lowers_the_filter_first():
+    controller = AdaptiveController(30, min_fps=10)
+    levels = run(controller, FakePipeline({"grab": 0.002, "convert": 0.04, "encode": 0.005}), 4)
+    assert [(level.interpolation, level.fps) for level in levels] == [(cv2.INTER_LINEAR, 30),
+                                                                     (cv2.INTER_NEAREST, 30)]
+
+
+def test_steps_back_up_once_there_is_headroom():
+    controller = AdaptiveController(30, min_fps=10)
+    pipeline = FakePipeline({"grab": 0.002, "convert": 0.005, "encode": 0.04})
+    run(controller, pipeline, 6)
+    pipeline.costs["encode"] = 0.005
+    run(controller, pipeline, 30, start=6)
+    assert (controller.current.interpolation, controller.current.fps) == (cv2.INTER_AREA, 30)
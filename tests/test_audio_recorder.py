@@ -0,0 +1,82 @@
+# Checks how AudioRecorder tells lost audio from a late consumer, recording the synthetic tone of
+# benchmarks/sources.FakeMicrophone: a stall while the "sound server" keeps buffering must not be
+# padded, a real gap in the samples must be filled with silence.
+import os
+import sys
+import threading
+import time
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+pytest.importorskip("numpy")
+sf = pytest.importorskip("soundfile")
+from sources import FakeMicrophone, FakeRecorder
+from AudioRecorder import AudioRecorder
+from Loudness import LoudnessMeter
+
+
+class StallingMeter(LoudnessMeter):
+    # Blocks the recording thread once, like a GIL-heavy capture stage would
+    def __init__(self, sample_rate, stall_after, stall):
+        super().__init__(sample_rate)
+        self.chunks = 0
+        self.stall_after = stall_after
+        self.stall = stall
+
+    def add(self, samples):
+        self.chunks += 1
+        if self.chunks == self.stall_after:
+            time.sleep(self.stall)
+        super().add(samples)
+
+
+class GapRecorder(FakeRecorder):
+    # Loses `gap` seconds of samples before the given chunk
+    def __init__(self, microphone, samplerate, gap_before, gap):
+        super().__init__(microphone, samplerate)
+        self.calls = 0
+        self.gap_before = gap_before
+        self.gap = gap
+
+    def record(self, numframes):
+        self.calls += 1
+        if self.calls == self.gap_before:
+            self.start += self.gap
+            time.sleep(self.gap)
+        return super().record(numframes)
+
+
+class GapMicrophone(FakeMicrophone):
+    def __init__(self, gap_before, gap):
+        super().__init__()
+        self.gap_before = gap_before
+        self.gap = gap
+
+    def recorder(self, samplerate, **kwargs):
+        return GapRecorder(self, samplerate, self.gap_before, self.gap)
+
+
+def record(tmp_path, microphone, meter=None, seconds=1.0):
+    path = str(tmp_path / "audio.wav")
+    audio = AudioRecorder(path, seconds, time.perf_counter(), microphone=microphone, meter=meter)
+    audio.record(threading.Event(), threading.Event())
+    assert audio.error is None
+    return audio, sf.info(path).duration
+
+
+def test_stalled_consumer_is_not_padded(tmp_path):
+    meter = StallingMeter(44100, stall_after=5, stall=0.15)
+    audio, duration = record(tmp_path, FakeMicrophone(), meter=meter)
+    assert audio.underruns == 0
+    assert audio.padded == 0
+    assert duration == pytest.approx(1.0, abs=0.001)  # No real audio cut from the end
+
+
+def test_lost_samples_are_padded_with_silence(tmp_path):
+    audio, duration = record(tmp_path, GapMicrophone(gap_before=5, gap=0.3))
+    assert audio.underruns == 1
+    assert audio.padded == pytest.approx(0.3, abs=0.03)
+    assert abs(audio.drift) < 0.03  # The samples after the gap stay on the shared clock
+    assert duration == pytest.approx(1.0, abs=0.05)  # Recording stops on a whole chunk
@@ -0,0 +1,104 @@
+# Checks CandidateCache expiry, eviction and the merge that lets several processes share one cache file.
+import multiprocessing
+import os
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import CandidateCache as candidate_cache
+from CandidateCache import CandidateCache
+
+QUERY, FILTER = "official music video", "EgIYAg%3D%3D"
+
+
+def video(name):
+    return {"href": f"https://www.youtube.com/watch?v={name}", "title": name, "duration": "5:00",
+            "duration_seconds": 300}
+
+
+def names(cache):
+    return [candidate["title"] for candidate in cache.get(QUERY, FILTER)[0]]
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # Controllable time.time() for the cache module
+    now = [1_000_000.0]
+    monkeypatch.setattr(candidate_cache.time, "time", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "candidate_cache.json")
+
+
+def test_entry_turns_stale_after_ttl(path, clock):
+    cache = CandidateCache(path, ttl=60, max_age=3600)
+    cache.put(QUERY, FILTER, [video("a"), video("b")])
+    assert cache.get(QUERY, FILTER)[1] is False
+    clock[0] += 61
+    candidates, stale = CandidateCache(path, ttl=60, max_age=3600).get(QUERY, FILTER)
+    assert [candidate["title"] for candidate in candidates] == ["a", "b"]  # Still used while refreshing
+    assert stale is True
+
+
+def test_entry_expires_after_max_age(path, clock):
+    cache = CandidateCache(path, ttl=60, max_age=3600)
+    cache.put(QUERY, FILTER, [video("a")])
+    clock[0] += 3601
+    assert cache.get(QUERY, FILTER) == ([], True)
+    cache.save()
+    assert CandidateCache(path).searches == {}
+
+
+def test_eviction_drops_least_recently_used(path, clock):
+    cache = CandidateCache(path, max_entries=3)
+    cache.put(QUERY, FILTER, [video("a"), video("b"), video("c")])
+    clock[0] += 1
+    cache.touch(video("a")["href"])
+    clock[0] += 1
+    cache.touch(video("c")["href"])
+    clock[0] += 1
+    cache.put("other query", FILTER, [video("d")])  # One over the limit: b was used longest ago
+    assert names(cache) == ["a", "c"]
+    assert names(CandidateCache(path, max_entries=3)) == ["a", "c"]
+
+
+def test_invalidation_survives_other_instances_touch_and_put(path, clock):
+    first = CandidateCache(path)
+    first.put(QUERY, FILTER, [video("a"), video("b"), video("c")])
+    second = CandidateCache(path)  # Its snapshot still holds b
+    first.invalidate(video("b")["href"])
+    clock[0] += 1
+    second.touch(video("c")["href"])
+    assert names(CandidateCache(path)) == ["a", "c"]
+    second.put("other query", FILTER, [video("d")])
+    assert names(CandidateCache(path)) == ["a", "c"]
+    # A newer fetch of the same search replaces it, without the link its own process found unavailable
+    clock[0] += 1
+    first.put(QUERY, FILTER, [video("b"), video("e")])
+    assert names(CandidateCache(path)) == ["e"]
+
+
+def touch_and_invalidate(path, worker):
+    cache = CandidateCache(path)
+    for _ in range(20):
+        cache.touch(video("a")["href"])
+    if worker == 0:
+        cache.invalidate(video("b")["href"])
+    for _ in range(20):
+        cache.touch(video("c")["href"])
+
+
+def test_concurrent_processes_keep_invalidation(path):
+    CandidateCache(path).put(QUERY, FILTER, [video("a"), video("b"), video("c")])
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=touch_and_invalidate, args=(path, worker)) for worker in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+    assert names(CandidateCache(path)) == ["a", "c"]
@@ -0,0 +1,103 @@
+# Checks Selenium.find_video against the saved search results page in benchmarks/fixtures:
+# the in-page extraction script in headless Firefox (skipped without geckodriver), and the
+# Python-side duration filtering with a stub driver.
+import os
+import shutil
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from Selenium import Selenium
+
+FIXTURE = os.path.join(ROOT, "benchmarks", "fixtures", "search_results.html")
+
+# (video id, title, duration text, seconds) of every result the script should return, in page order;
+# the premiere without a duration overlay is skipped, the live stream has no parsable duration
+EXPECTED = [
+    ("dQw4w9WgXcQ", "Rick Astley - Never Gonna Give You Up (Official Music Video)", "3:33", 213),
+    ("kJQP7kiw5Fk", "Luis Fonsi - Despacito ft. Daddy Yankee", "4:42", 282),
+    ("9bZkp7q19f0", "PSY - GANGNAM STYLE(강남스타일) M/V", "4:13", 253),
+    ("aaaaaaaaaa1", "Short Teaser (Official Video)", "0:45", 45),
+    ("JGwWNGJdvx8", "Ed Sheeran - Shape of You (Official Music Video)", "4:24", 264),
+    ("aaaaaaaaaa2", "Live Concert Stream", "LIVE", None),
+    ("OPf0YbXqDm0", "Mark Ronson - Uptown Funk (Official Video) ft. Bruno Mars", "4:31", 271),
+    ("aaaaaaaaaa3", "Band - Interlude (Official Audio)", "1:58", 118),
+    ("fJ9rUzIMcZQ", "Queen – Bohemian Rhapsody (Official Video Remastered)", "5:59", 359),
+    ("aaaaaaaaaa4", "Orchestra - Full Symphony (Official Video)", "1:02:17", 3737),
+]
+
+
+class StubDriver:
+    # Stands in for the WebDriver: execute_script returns canned records instead of running the script
+    def __init__(self, videos):
+        self.videos = videos
+
+    def execute_script(self, script):
+        return self.videos
+
+    def execute(self, command, params=None):
+        raise AssertionError(f"Unexpected WebDriver command {command}")
+
+
+def record(video_id, title, duration, seconds, href=None):
+    return {"href": href or f"https://www.youtube.com/watch?v={video_id}", "title": title,
+            "duration": duration, "duration_seconds": seconds}
+
+
+@pytest.fixture(scope="module")
+def firefox():
+    if not shutil.which("geckodriver"):
+        pytest.skip("geckodriver is not installed")
+    from selenium import webdriver
+    options = webdriver.FirefoxOptions()
+    options.add_argument("-headless")
+    try:
+        driver = webdriver.Firefox(options=options)
+    except Exception as e:
+        pytest.skip(f"Firefox could not be started: {e}")
+    yield driver
+    driver.quit()
+
+
+def test_extract_script_reads_fixture(firefox):
+    firefox.get("file://" + FIXTURE)
+    videos = firefox.execute_script(Selenium.EXTRACT_VIDEOS_SCRIPT)
+    assert [(video["href"].rsplit("=", 1)[-1], video["title"], video["duration"], video["duration_seconds"])
+            for video in videos] == EXPECTED
+    assert all(video["href"].endswith(f"/watch?v={video_id}") for video, (video_id, *_) in zip(videos, EXPECTED))
+    assert "Upcoming Premiere" not in [video["title"] for video in videos]
+
+
+def test_find_video_filters_by_duration():
+    selenium = Selenium(60, driver=StubDriver([record(*expected) for expected in EXPECTED]))
+    selenium.find_video()
+    # Longer than min_video_duration (120 s); the live stream and short clips are left out
+    assert [video["title"] for video in selenium.long_videos] == [
+        title for _, title, _, seconds in EXPECTED if seconds and seconds > 120]
+
+
+def test_find_video_skips_missing_duration_and_href():
+    videos = [
+        record("aaaaaaaaaa2", "Live Concert Stream", "LIVE", None),
+        {"href": None, "title": "No Link", "duration": "5:00", "duration_seconds": 300},
+        record("fJ9rUzIMcZQ", "Bohemian Rhapsody", "5:59", 359),
+    ]
+    selenium = Selenium(60, driver=StubDriver(videos))
+    selenium.find_video()
+    assert selenium.long_videos == [videos[2]]
+
+
+def test_find_video_raises_without_long_videos():
+    selenium = Selenium(60, driver=StubDriver([record("aaaaaaaaaa1", "Short Teaser", "0:45", 45),
+                                               record("aaaaaaaaaa2", "Live", "LIVE", None)]))
+    with pytest.raises(ValueError):
+        selenium.find_video()
+    selenium.find_video(required=False)  # While scrolling an empty list is fine
+    assert selenium.long_videos == []
+
+
+def test_find_video_handles_no_results():
+    selenium = Selenium(60, driver=StubDriver(None))
+    selenium.find_video(required=False)
+    assert selenium.long_videos == []
@@ -0,0 +1,82 @@
+# Checks that Encoder keeps the capture timestamps of a variable frame rate recording, both in a
+# single file and when the segments of a segmented recording are joined by Encoder.mux, and that the
+# AAC segments written by AudioRecorder land at their recorded times when copied in.
+# Skipped without MoviePy's ffmpeg.
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+import types
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+np = pytest.importorskip("numpy")
+pytest.importorskip("moviepy.config")
+from Encoder import Encoder, ffmpeg_binary
+
+# Capture times of a mostly static screen: far apart, and not on any frame rate's grid
+CAPTURED = [0.0, 1.0, 2.03, 3.07, 3.97]
+
+
+def frame_times(path):
+    # Presentation time of every frame, as decoded by ffmpeg
+    result = subprocess.run([ffmpeg_binary(), '-i', path, '-vf', 'showinfo', '-f', 'null', '-'],
+                            stderr=subprocess.PIPE, text=True, check=True)
+    return [float(value) for value in re.findall(r"pts_time:([\d.]+)", result.stderr)]
+
+
+def record(tmp_path, segment_time):
+    encoder = Encoder(str(tmp_path / "video.mp4"), 64, 48, 30, segment_time=segment_time)
+    encoder.start()
+    for i, timestamp in enumerate(CAPTURED):
+        encoder.write(types.SimpleNamespace(frame=np.full((48, 64, 3), i * 40, np.uint8), timestamp=timestamp))
+    encoder.close()
+    output = str(tmp_path / "final.mp4")
+    encoder.mux(None, output, duration=encoder.last_timestamp / 1000 + 1 / 30)
+    return frame_times(output)
+
+
+def test_single_file_keeps_capture_times(tmp_path):
+    assert record(tmp_path, None) == pytest.approx(CAPTURED, abs=0.002)
+
+
+@pytest.mark.parametrize("segment_time", [0.5, 1.5])
+def test_joined_segments_keep_capture_times(tmp_path, segment_time):
+    assert record(tmp_path, segment_time) == pytest.approx(CAPTURED, abs=0.002)
+
+
+def test_segmented_audio_is_copied_at_its_timestamps(tmp_path):
+    # Clicks once a second, recorded in 1 s segments that are encoded to AAC while recording
+    pytest.importorskip("soundfile")
+    from sources import FakeMicrophone
+    from AudioRecorder import AudioRecorder
+
+    class ClickMicrophone(FakeMicrophone):
+        def generate(self, first, numframes, samplerate):
+            position = np.arange(first, first + numframes)
+            mono = np.where(position % samplerate < 200, 0.8, 0.0)
+            return np.repeat(mono[:, None], self.channels, axis=1).astype(np.float32)
+
+    audio = AudioRecorder(str(tmp_path / "audio.wav"), 3.0, time.perf_counter(), microphone=ClickMicrophone(),
+                          segment_time=1.0)
+    audio.record(threading.Event(), threading.Event())
+    assert audio.segments_encoded
+
+    encoder = Encoder(str(tmp_path / "video.mp4"), 64, 48, 30, segment_time=1.0)
+    encoder.start()
+    for i, timestamp in enumerate(CAPTURED[:4]):
+        encoder.write(types.SimpleNamespace(frame=np.full((48, 64, 3), i * 40, np.uint8), timestamp=timestamp))
+    encoder.close()
+    output = str(tmp_path / "final.mp4")
+    encoder.mux(audio.encoded_playlist, output, duration=3.0, audio_codec='copy')
+
+    # Decode the audio placed on the video's timeline and find the click onsets
+    raw = subprocess.run([ffmpeg_binary(), '-loglevel', 'error', '-i', output, '-vn', '-af', 'aresample=first_pts=0',
+                          '-ac', '1', '-f', 'f32le', '-'], stdout=subprocess.PIPE, check=True).stdout
+    samples = np.abs(np.frombuffer(raw, np.float32))
+    onsets = np.flatnonzero((samples[1:] > 0.4) & (samples[:-1] <= 0.4)) / audio.sample_rate
+    assert list(onsets) == pytest.approx([1.0, 2.0], abs=0.002)